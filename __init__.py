@@ -5,7 +5,9 @@
 from trytond.pool import Pool
 from . import account_check_ar
 from . import account_voucher_ar
+from . import portfolio
 from . import statement
+from . import stats
 
 __all__ = ['register']
 
@@ -15,8 +17,13 @@ def register():
         account_check_ar.AccountCheckbook,
         account_check_ar.AccountIssuedCheck,
         account_check_ar.AccountThirdCheck,
+        account_check_ar.ThirdCheckDepositSlip,
         account_check_ar.AccountVoucherThirdCheck,
+        account_check_ar.CheckStateLog,
         account_check_ar.Journal,
+        account_check_ar.BankAccount,
+        account_check_ar.Period,
+        account_check_ar.Cron,
         account_check_ar.ThirdCheckHeldStart,
         account_check_ar.ThirdCheckDepositStart,
         account_check_ar.ThirdCheckRevertDepositStart,
@@ -26,13 +33,21 @@ def register():
         account_check_ar.ThirdCheckRevertRejectStart,
         account_check_ar.IssuedCheckCashStart,
         account_check_ar.IssuedCheckCancelStart,
+        account_check_ar.ThirdCheckImportStart,
         account_voucher_ar.AccountVoucher,
+        portfolio.CheckPortfolio,
+        portfolio.CheckPortfolioContext,
+        portfolio.CheckProjection,
+        portfolio.CheckProjectionContext,
+        stats.CheckStat,
         module='account_check_ar', type_='model')
     Pool.register(
         statement.AccountIssuedCheck,
         statement.AccountThirdCheck,
+        statement.ThirdCheckDepositSlip,
         statement.Statement,
         statement.StatementLine,
+        statement.StatementLineCheckReview,
         module='account_check_ar', type_='model',
         depends=['account_statement'])
     Pool.register(
@@ -45,4 +60,5 @@ def register():
         account_check_ar.ThirdCheckRevertReject,
         account_check_ar.IssuedCheckCash,
         account_check_ar.IssuedCheckCancel,
+        account_check_ar.ThirdCheckImport,
         module='account_check_ar', type_='wizard')
@@ -1,21 +1,81 @@
 # This file is part of the account_check_ar module for Tryton.
 # The COPYRIGHT file at the top level of this repository contains
 # the full copyright notices and license terms.
-from decimal import Decimal
-
-from trytond.model import Workflow, ModelView, ModelSQL, fields
+import csv
+import datetime
+import io
+import logging
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from weakref import WeakKeyDictionary
+
+from sql import Column, Literal, Null, Window
+from sql.aggregate import Count, Min, Sum
+from sql.conditionals import Coalesce
+from sql.functions import CurrentTimestamp, Position, RowNumber, Substring
+from sql.operators import Concat
+
+from trytond import backend
+from trytond.model import Model, Workflow, ModelView, ModelSQL, Index, fields
+from trytond.modules.account.exceptions import PeriodNotFoundError
 from trytond.modules.currency.fields import Monetary
 from trytond.wizard import Wizard, StateView, StateTransition, Button
-from trytond.pool import Pool
+from trytond.pool import Pool, PoolMeta
 from trytond.pyson import Bool, Eval, In, And, Or, Id
-from trytond.transaction import Transaction
+from trytond.transaction import Transaction, without_check_access
 from trytond.exceptions import UserError
 from trytond.i18n import gettext
+from trytond.tools import cached_property, grouped_slice, reduce_ids
+
+from .stats import add_moves, instrumented
 
+logger = logging.getLogger(__name__)
 _STATES = {
     'readonly': Eval('state') != 'draft',
     }
 _ZERO = Decimal('0.0')
+# The lookups of move building memoized by transaction
+_lookups = WeakKeyDictionary()
+
+
+def _get_lookups():
+    return _lookups.setdefault(Transaction(), {})
+
+
+def find_period(company, date):
+    "Return the period of the company at the date for the transaction"
+    Period = Pool().get('account.period')
+    lookups = _get_lookups()
+    key = ('account.period',
+        int(company) if company is not None else None, date)
+    if key not in lookups:
+        lookups[key] = Period.find(company, date=date).id
+    return Period(lookups[key])
+
+
+def lookup(record, path):
+    """Return the value of the dotted path of Many2One fields from the
+    record, like the accounts of a journal or a bank account, for the
+    transaction"""
+    lookups = _get_lookups()
+    key = (record.__name__, record.id, path)
+    if key not in lookups:
+        value = record
+        for name in path.split('.'):
+            value = getattr(value, name, None)
+            if value is None:
+                break
+        lookups[key] = (value.__name__, value.id) if value else None
+    if lookups[key] is None:
+        return None
+    model, id_ = lookups[key]
+    return Pool().get(model)(id_)
+
+
+def clear_lookups():
+    "Clear the lookups memoized for the transaction"
+    _lookups.pop(Transaction(), None)
 
 
 class AccountCheckbook(Workflow, ModelSQL, ModelView):
@@ -42,6 +102,53 @@ class AccountCheckbook(Workflow, ModelSQL, ModelView):
         ('active', 'Active'),
         ('closed', 'Closed'),
         ], 'State', readonly=True)
+    issued_checks = fields.Integer('Issued Checks', readonly=True,
+        help="The number of checks of the checkbook which are issued.")
+    debited_checks = fields.Integer('Debited Checks', readonly=True)
+    canceled_checks = fields.Integer('Canceled Checks', readonly=True)
+    remaining_checks = fields.Function(fields.Integer('Remaining Checks',
+            states={
+                'invisible': Bool(Eval('electronic')),
+                }),
+        'get_remaining_checks')
+    first_use_date = fields.Date('First Use Date', readonly=True)
+    depletion_date = fields.Function(fields.Date('Depletion Date',
+            states={
+                'invisible': Bool(Eval('electronic')),
+                },
+            help="The date when the checkbook is expected to be depleted "
+            "at the usage rate since its first use."),
+        'get_depletion_date')
+
+    @classmethod
+    def __register__(cls, module_name):
+        pool = Pool()
+        IssuedCheck = pool.get('account.issued.check')
+        table = cls.__table__()
+        check = IssuedCheck.__table__()
+        cursor = Transaction().connection.cursor()
+
+        table_h = cls.__table_handler__(module_name)
+        migrate_counters = (not table_h.column_exist('issued_checks')
+            and backend.TableHandler.table_exist(IssuedCheck._table))
+
+        super().__register__(module_name)
+
+        # Migration from 7.0: count the checks of existing checkbooks
+        if migrate_counters:
+            columns = [table.issued_checks, table.debited_checks,
+                table.canceled_checks]
+            values = [
+                check.select(Count(check.id),
+                    where=(check.checkbook == table.id)
+                    & (check.state == state))
+                for state in ['issued', 'debited', 'canceled']]
+            columns.append(table.first_use_date)
+            values.append(check.select(
+                    Min(Coalesce(check.date_out, check.date)),
+                    where=(check.checkbook == table.id)
+                    & (check.state != 'draft')))
+            cursor.execute(*table.update(columns, values))
 
     @classmethod
     def __setup__(cls):
@@ -84,8 +191,151 @@ class AccountCheckbook(Workflow, ModelSQL, ModelView):
     def default_state():
         return 'draft'
 
-    def get_party_company(self, name=None):
-        return self.default_party_company()
+    @classmethod
+    def default_issued_checks(cls):
+        return 0
+
+    @classmethod
+    def default_debited_checks(cls):
+        return 0
+
+    @classmethod
+    def default_canceled_checks(cls):
+        return 0
+
+    @classmethod
+    def get_party_company(cls, records, name):
+        party_company = cls.default_party_company()
+        return {r.id: party_company for r in records}
+
+    def get_remaining_checks(self, name):
+        if self.electronic or self.last_number is None:
+            return
+        return max(self.last_number - self.sequence.number_next + 1, 0)
+
+    def get_depletion_date(self, name):
+        Date = Pool().get('ir.date')
+        remaining = self.remaining_checks
+        used = ((self.issued_checks or 0) + (self.debited_checks or 0)
+            + (self.canceled_checks or 0))
+        if remaining is None or not used or not self.first_use_date:
+            return
+        today = Date.today()
+        days = max((today - self.first_use_date).days, 1)
+        return today + datetime.timedelta(days=remaining * days // used)
+
+    @classmethod
+    def update_counters(cls, changes):
+        '''
+        Update the counters of the checkbooks with the list of
+        (check, previous state, state) of the issued checks.
+        '''
+        pool = Pool()
+        Date = pool.get('ir.date')
+        table = cls.__table__()
+        transaction = Transaction()
+        cursor = transaction.connection.cursor()
+
+        counters = {
+            'issued': 'issued_checks',
+            'debited': 'debited_checks',
+            'canceled': 'canceled_checks',
+            }
+        deltas = defaultdict(lambda: defaultdict(int))
+        for check, from_state, state in changes:
+            if not check.checkbook:
+                continue
+            if from_state in counters:
+                deltas[check.checkbook.id][counters[from_state]] -= 1
+            if state in counters:
+                deltas[check.checkbook.id][counters[state]] += 1
+        if not deltas:
+            return
+
+        # Lock and read the stored counters to not lose concurrent updates
+        checkbooks = cls.browse(list(deltas))
+        cls.lock(checkbooks)
+        stored = {}
+        for sub_ids in grouped_slice(list(deltas)):
+            cursor.execute(*table.select(table.id,
+                    *(Column(table, n) for n in counters.values()),
+                    table.first_use_date,
+                    where=reduce_ids(table.id, sub_ids)))
+            for id_, *values in cursor:
+                stored[id_] = dict(zip(
+                        list(counters.values()) + ['first_use_date'],
+                        values))
+
+        date = transaction.context.get('check_state_date') or Date.today()
+        to_write = []
+        for checkbook in checkbooks:
+            values = {
+                name: (stored[checkbook.id][name] or 0) + count
+                for name, count in deltas[checkbook.id].items() if count}
+            if not stored[checkbook.id]['first_use_date']:
+                values['first_use_date'] = date
+            if values:
+                to_write.extend(([checkbook], values))
+        if to_write:
+            cls.write(*to_write)
+
+    def reserve_numbers(self, count):
+        '''
+        Return a block of count numbers from the sequence.
+        The numbers of SQL sequences are taken with nextval so they never
+        collide with the other consumers of the sequence, otherwise the
+        sequence is locked and moved forward only once.
+        '''
+        pool = Pool()
+        Sequence = pool.get('ir.sequence')
+
+        if count <= 0:
+            return []
+        if self.sequence.type != 'incremental':
+            raise UserError(gettext(
+                    'account_check_ar.msg_checkbook_sequence_not_incremental',
+                    checkbook=self.rec_name))
+        if backend.Database.has_sequence() and not Sequence._strict:
+            return [self.sequence.get() for _ in range(count)]
+        with without_check_access():
+            Sequence.lock([self.sequence])
+            sequence = Sequence(self.sequence.id)
+            number_next = sequence.number_next
+            increment = sequence.number_increment
+            Sequence.write([sequence], {
+                    'number_next': number_next + count * increment,
+                    })
+        return [Sequence(
+                prefix=sequence.prefix,
+                suffix=sequence.suffix,
+                type=sequence.type,
+                padding=sequence.padding,
+                number_next=number_next + i * increment,
+                ).on_change_with_preview()
+            for i in range(count)]
+
+    @classmethod
+    def create_canceled_checks(cls, checkbooks, names, date):
+        "Create the canceled checks with the names not used yet"
+        pool = Pool()
+        IssuedCheck = pool.get('account.issued.check')
+
+        to_create = []
+        for checkbook in checkbooks:
+            existing = set()
+            for sub_names in grouped_slice(names):
+                existing.update(c.name for c in IssuedCheck.search([
+                            ('name', 'in', list(sub_names)),
+                            ('bank_account', '=', checkbook.bank_account.id),
+                            ]))
+            to_create.extend({
+                    'name': name,
+                    'checkbook': checkbook.id,
+                    'bank_account': checkbook.bank_account.id,
+                    'date': date,
+                    'state': 'canceled',
+                    } for name in names if name not in existing)
+        return IssuedCheck.create(to_create)
 
     @classmethod
     def copy(cls, checkbooks, default=None):
@@ -94,9 +344,14 @@ class AccountCheckbook(Workflow, ModelSQL, ModelView):
         else:
             default = default.copy()
         default.setdefault('name', None)
+        default.setdefault('issued_checks', 0)
+        default.setdefault('debited_checks', 0)
+        default.setdefault('canceled_checks', 0)
+        default.setdefault('first_use_date')
         return super(AccountCheckbook, cls).copy(checkbooks, default=default)
 
     @classmethod
+    @instrumented
     @ModelView.button
     @Workflow.transition('draft')
     def draft(cls, checkbooks):
@@ -109,12 +364,14 @@ class AccountCheckbook(Workflow, ModelSQL, ModelView):
                     gettext('account_check_ar.msg_checkbook_to_draft'))
 
     @classmethod
+    @instrumented
     @ModelView.button
     @Workflow.transition('active')
     def activate(cls, checkbooks):
         pass
 
     @classmethod
+    @instrumented
     @ModelView.button
     @Workflow.transition('closed')
     def close(cls, checkbooks):
@@ -129,7 +386,128 @@ class AccountCheckbook(Workflow, ModelSQL, ModelView):
         return super(AccountCheckbook, cls).delete(checkbooks)
 
 
-class AccountIssuedCheck(ModelSQL, ModelView):
+class CheckQueueMixin:
+    'Mixin to run check wizards in background'
+    __slots__ = ()
+
+    queue_state = fields.Selection([
+        (None, ''),
+        ('queued', 'Queued'),
+        ('failed', 'Failed'),
+        ], 'Background State', readonly=True,
+        states={'invisible': ~Eval('queue_state')})
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls._buttons.update({
+            'reset_queue': {
+                'invisible': ~Eval('queue_state'),
+                'depends': ['queue_state'],
+                },
+            })
+
+    @classmethod
+    @ModelView.button
+    def reset_queue(cls, records):
+        "Release the records from a failed or lost background run"
+        cls.write(records, {'queue_state': None})
+
+    @classmethod
+    def enqueue_wizard(cls, records, wizard, transition, start):
+        "Run the wizard transition on the records in background chunks"
+        transaction = Transaction()
+        cls.write(list(records), {'queue_state': 'queued'})
+        with transaction.set_context(
+                queue_batch=transaction.context.get('queue_batch', True)):
+            cls.__queue__.run_wizard(records, wizard, transition, start)
+
+    @classmethod
+    def run_wizard(cls, records, wizard, transition, start):
+        pool = Pool()
+        Wizard = pool.get(wizard, type='wizard')
+        transaction = Transaction()
+
+        ids = [r.id for r in records]
+        try:
+            # Release the checks so the wizard can process them
+            cls.write(list(records), {'queue_state': None})
+            session_id, _, _ = Wizard.create()
+            instance = Wizard(session_id)
+            for name, value in start.items():
+                setattr(instance.start, name, value)
+            with transaction.set_context(
+                    active_model=cls.__name__,
+                    active_id=ids[0] if ids else None,
+                    active_ids=ids):
+                getattr(instance, 'transition_%s' % transition)()
+            Wizard.delete(session_id)
+        except Exception:
+            # Flag the failed chunk without altering the other chunks
+            transaction.rollback()
+            clear_lookups()
+            with transaction.new_transaction() as new_transaction:
+                cls.write(cls.browse(ids), {'queue_state': 'failed'})
+                new_transaction.commit()
+            raise
+
+
+class CheckStateLogMixin:
+    'Mixin to log the state changes of checks'
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, vlist):
+        checks = super().create(vlist)
+        cls.log_state([(c, None, c.state) for c in checks])
+        return checks
+
+    @classmethod
+    def write(cls, *args):
+        pool = Pool()
+        Projection = pool.get('account.check.projection')
+        actions = iter(args)
+        to_log = []
+        projected = False
+        for checks, values in zip(actions, actions):
+            if 'state' in values:
+                # Read the stored states as the instances may be modified
+                to_log.extend((c, c.state, values['state'])
+                    for c in cls.browse([c.id for c in checks])
+                    if c.state != values['state'])
+            if values.keys() & {'date', 'clearing', 'amount', 'currency'}:
+                projected = True
+        super().write(*args)
+        if projected:
+            Projection._cache.clear()
+        cls.log_state(to_log)
+
+    @classmethod
+    def log_state(cls, changes):
+        """Append a state log for each (check, previous state, state)
+
+        The date of the change is taken from the check_state_date key of
+        the context or is today.
+        """
+        pool = Pool()
+        Log = pool.get('account.check.state.log')
+        Projection = pool.get('account.check.projection')
+        Date = pool.get('ir.date')
+
+        if not changes:
+            return
+        Projection._cache.clear()
+        date = Transaction().context.get('check_state_date') or Date.today()
+        Log.create([{
+                    'check': str(check),
+                    'from_state': from_state,
+                    'state': state,
+                    'date': date,
+                    } for check, from_state, state in changes])
+
+
+class AccountIssuedCheck(
+        CheckQueueMixin, CheckStateLogMixin, ModelSQL, ModelView):
     'Account Issued Check'
     __name__ = 'account.issued.check'
 
@@ -170,6 +548,8 @@ class AccountIssuedCheck(ModelSQL, ModelView):
         states={'invisible': Eval('state') == 'draft'})
     cash_move = fields.Many2One('account.move', 'Cash Move', readonly=True,
         states={'invisible': Eval('state') == 'draft'})
+    debit_move = fields.Many2One('account.move', 'Debit Move', readonly=True,
+        states={'invisible': ~Eval('debit_move')})
     state = fields.Selection([
         ('draft', 'Draft'),
         ('issued', 'Issued'),
@@ -190,6 +570,19 @@ class AccountIssuedCheck(ModelSQL, ModelView):
     @classmethod
     def __setup__(cls):
         super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.update({
+            Index(t,
+                (t.name, Index.Equality()),
+                (t.bank_account, Index.Equality())),
+            Index(t, (t.checkbook, Index.Equality())),
+            Index(t,
+                (t.state, Index.Equality()),
+                where=t.state.in_(['draft', 'issued'])),
+            Index(t,
+                (t.date, Index.Range()),
+                where=t.state == 'issued'),
+            })
         cls._buttons.update({
             'issued': {
                 'invisible': Eval('state') != 'draft',
@@ -209,8 +602,10 @@ class AccountIssuedCheck(ModelSQL, ModelView):
         if Transaction().context.get('company'):
             return Company(Transaction().context['company']).party.id
 
-    def get_party_company(self, name=None):
-        return self.default_party_company()
+    @classmethod
+    def get_party_company(cls, records, name):
+        party_company = cls.default_party_company()
+        return {r.id: party_company for r in records}
 
     @staticmethod
     def default_date_out():
@@ -234,9 +629,7 @@ class AccountIssuedCheck(ModelSQL, ModelView):
         self.bank_account = None
         self.name = None
         if self.checkbook:
-            if self.checkbook.electronic is False and \
-                    self.checkbook.sequence.number_next > \
-                    self.checkbook.last_number:
+            if self.checkbook.remaining_checks == 0:
                 raise UserError(
                     gettext(
                         'account_check_ar.msg_checkbook_last_number_reached'))
@@ -256,6 +649,8 @@ class AccountIssuedCheck(ModelSQL, ModelView):
             default = default.copy()
         default.setdefault('name', None)
         default.setdefault('state', cls.default_state())
+        default.setdefault('debit_move', None)
+        default.setdefault('queue_state', None)
         return super().copy(checks, default=default)
 
     @classmethod
@@ -268,21 +663,153 @@ class AccountIssuedCheck(ModelSQL, ModelView):
         return super().delete(checks)
 
     @classmethod
+    def log_state(cls, changes):
+        pool = Pool()
+        Checkbook = pool.get('account.checkbook')
+        super().log_state(changes)
+        Checkbook.update_counters(changes)
+
+    @classmethod
+    @instrumented
     def issued(cls, checks):
         pass
 
     @classmethod
+    @instrumented
     @ModelView.button
     def debited(cls, checks):
         pass
 
+    @classmethod
+    def _get_matured_domain(cls, date):
+        "Return the domain of the issued checks cleared at date"
+        domain = ['OR']
+        for clearing, _ in cls.clearing.selection:
+            delay = datetime.timedelta(hours=int(clearing or 0))
+            domain.append([
+                    ('clearing', '=', clearing),
+                    ('date', '<=', date - delay),
+                    ])
+        return [
+            ('state', '=', 'issued'),
+            domain,
+            # The queued checks are processed by their own background run
+            ['OR',
+                ('queue_state', '=', None),
+                ('queue_state', '!=', 'queued'),
+                ],
+            ]
+
+    @classmethod
+    def get_clearing_date(cls, check):
+        return check.date + datetime.timedelta(hours=int(check.clearing or 0))
+
+    @classmethod
+    def get_debit_period(cls, company, day, date):
+        """Return the date and the period of the debit move of the checks
+        cleared at day
+
+        The move is dated at date when the period of day is not open."""
+        try:
+            return day, find_period(company, day)
+        except PeriodNotFoundError:
+            return date, find_period(company, date)
+
+    @classmethod
+    @instrumented
+    def debit_matured(cls, date=None):
+        """Debit the issued checks cleared at date
+
+        A move is created for each bank account and clearing day.
+        The bank accounts without issued check account or open period are
+        skipped.
+        """
+        pool = Pool()
+        Date = pool.get('ir.date')
+        Move = pool.get('account.move')
+        MoveLine = pool.get('account.move.line')
+
+        if date is None:
+            date = Date.today()
+        company_id = Transaction().context.get('company')
+        if not company_id:
+            return
+        checks = cls.search(cls._get_matured_domain(date) + [
+                ('bank_account.journal.company', '=', company_id),
+                ], order=[('bank_account', 'ASC'), ('date', 'ASC')])
+
+        bank_checks = defaultdict(list)
+        for check in checks:
+            bank_checks[check.bank_account].append(check)
+        for bank_account, checks in bank_checks.items():
+            journal = lookup(bank_account, 'journal')
+            if not lookup(journal, 'issued_check_account'):
+                logger.warning(
+                    "Skip debit of matured checks of bank account %s "
+                    "without issued check account", bank_account.id)
+                continue
+            day_checks = defaultdict(list)
+            for check in checks:
+                day_checks[cls.get_clearing_date(check)].append(check)
+            try:
+                day2period = {day: cls.get_debit_period(
+                        journal.company, day, date) for day in day_checks}
+            except PeriodNotFoundError:
+                logger.warning(
+                    "Skip debit of matured checks of bank account %s "
+                    "without open period", bank_account.id, exc_info=True)
+                continue
+
+            moves_values, moves_lines = [], []
+            for day, checks in sorted(day_checks.items()):
+                move_date, period = day2period[day]
+                moves_values.append({
+                        'journal': journal.id,
+                        'period': period.id,
+                        'date': move_date,
+                        'description': 'Débito Cheques: ' + ', '.join(
+                            c.name for c in checks),
+                        })
+                lines = [{
+                        'account': lookup(journal, 'issued_check_account').id,
+                        'journal': journal.id,
+                        'period': period.id,
+                        'debit': check.amount,
+                        'credit': _ZERO,
+                        'date': move_date,
+                        } for check in checks]
+                lines.append({
+                        'account': lookup(bank_account, 'debit_account').id,
+                        'journal': journal.id,
+                        'period': period.id,
+                        'debit': _ZERO,
+                        'credit': sum(c.amount for c in checks),
+                        'date': move_date,
+                        })
+                moves_lines.append(lines)
+            moves = Move.create(moves_values)
+            day2move = dict(zip(sorted(day_checks), moves))
+            MoveLine.create([{**line, 'move': move.id}
+                    for move, lines in zip(moves, moves_lines)
+                    for line in lines])
+            add_moves(moves)
+            for day, checks in day_checks.items():
+                with Transaction().set_context(check_state_date=day):
+                    cls.write(checks, {
+                            'state': 'debited',
+                            'debit_date': day,
+                            'debit_move': day2move[day].id,
+                            })
+            Move.post(moves)
+
     @ModelView.button_change('voucher',
         '_parent_voucher.amount_invoices', '_parent_voucher.amount')
     def calculate_remaining_amount(self):
         self.amount = self.voucher.amount_invoices - self.voucher.amount
 
 
-class AccountThirdCheck(ModelSQL, ModelView):
+class AccountThirdCheck(
+        CheckQueueMixin, CheckStateLogMixin, ModelSQL, ModelView):
     'Account Third Check'
     __name__ = 'account.third.check'
 
@@ -333,12 +860,35 @@ class AccountThirdCheck(ModelSQL, ModelView):
     bank = fields.Many2One('bank', 'Bank', required=True, states=_states)
     account_bank_out = fields.Many2One('bank.account', 'Bank Account',
         readonly=True, states={'invisible': Eval('state') != 'deposited'})
+    deposit_slip = fields.Many2One('account.third.check.deposit.slip',
+        'Deposit Slip', readonly=True, ondelete='RESTRICT',
+        states={'invisible': ~Eval('deposit_slip')})
+    held_move = fields.Many2One('account.move', 'Held Move', readonly=True,
+        states={'invisible': ~Eval('held_move')})
+    deposit_move = fields.Many2One('account.move', 'Deposit Move',
+        readonly=True, states={'invisible': ~Eval('deposit_move')})
+    reject_move = fields.Many2One('account.move', 'Reject Move',
+        readonly=True, states={'invisible': ~Eval('reject_move')})
 
     del _states
 
     @classmethod
     def __setup__(cls):
         super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.update({
+            Index(t,
+                (t.bank, Index.Equality()),
+                (t.name, Index.Equality()),
+                (t.source_party, Index.Equality())),
+            Index(t,
+                (t.state, Index.Equality()),
+                where=t.state.in_(['draft', 'held', 'reverted'])),
+            Index(t,
+                (t.date, Index.Range()),
+                where=t.state.in_(['held', 'reverted'])),
+            Index(t, (t.deposit_slip, Index.Equality())),
+            })
         cls._order = [
             ('date', 'ASC'),
             ]
@@ -387,16 +937,37 @@ class AccountThirdCheck(ModelSQL, ModelView):
 
     @classmethod
     def check_duplicate_check(cls, checks):
-        for check in checks:
-            if cls.search_count([
-                    ('id', '!=', check.id),
-                    ('bank', '=', check.bank),
-                    ('name', '=', check.name),
-                    ('source_party', '=', check.source_party),
-                    ]) > 0:
-                raise UserError(gettext(
-                    'account_check_ar.msg_third_check_already_exists',
-                    check=check.name))
+        cursor = Transaction().connection.cursor()
+        table = cls.__table__()
+
+        def in_(column, values):
+            values_ = [v for v in values if v is not None]
+            where = column.in_(values_) if values_ else Literal(False)
+            if None in values:
+                where |= column == Null
+            return where
+
+        for sub_checks in grouped_slice(checks):
+            sub_checks = list(sub_checks)
+            keys = {(c.bank.id, c.name,
+                    c.source_party.id if c.source_party else None)
+                for c in sub_checks}
+            banks, names, parties = (set(k) for k in zip(*keys))
+            cursor.execute(*table.select(
+                    table.bank, table.name, table.source_party,
+                    where=(table.bank.in_(list(banks))
+                        & in_(table.name, names)
+                        & in_(table.source_party, parties)),
+                    group_by=[table.bank, table.name, table.source_party],
+                    having=Count(table.id) > 1))
+            duplicates = set(cursor) & keys
+            for check in sub_checks:
+                key = (check.bank.id, check.name,
+                    check.source_party.id if check.source_party else None)
+                if key in duplicates:
+                    raise UserError(gettext(
+                        'account_check_ar.msg_third_check_already_exists',
+                        check=check.name))
 
     @classmethod
     def copy(cls, checks, default=None):
@@ -406,6 +977,11 @@ class AccountThirdCheck(ModelSQL, ModelView):
             default = default.copy()
         default.setdefault('name', None)
         default.setdefault('state', cls.default_state())
+        default.setdefault('deposit_slip', None)
+        default.setdefault('held_move', None)
+        default.setdefault('deposit_move', None)
+        default.setdefault('reject_move', None)
+        default.setdefault('queue_state', None)
         return super().copy(checks, default=default)
 
     @classmethod
@@ -442,6 +1018,70 @@ class AccountThirdCheck(ModelSQL, ModelView):
         pass
 
 
+class ThirdCheckDepositSlip(ModelSQL, ModelView):
+    'Third Check Deposit Slip'
+    __name__ = 'account.third.check.deposit.slip'
+
+    reference = fields.Char('Reference', readonly=True)
+    date = fields.Date('Date', required=True, readonly=True)
+    bank_account = fields.Many2One('bank.account', 'Bank Account',
+        required=True, readonly=True, ondelete='RESTRICT')
+    currency = fields.Many2One('currency.currency', 'Currency',
+        required=True, readonly=True)
+    amount = Monetary("Amount", currency='currency', digits='currency',
+        required=True, readonly=True)
+    checks = fields.One2Many('account.third.check', 'deposit_slip',
+        'Checks', readonly=True)
+    move = fields.Many2One('account.move', 'Move', readonly=True,
+        states={'invisible': ~Eval('move')})
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.add(
+            Index(t,
+                (t.bank_account, Index.Equality()),
+                (t.date, Index.Range())))
+        cls._order.insert(0, ('date', 'DESC'))
+
+    def get_rec_name(self, name):
+        return ' - '.join(filter(None, [
+                    self.reference, str(self.date),
+                    self.bank_account.rec_name]))
+
+    @classmethod
+    def search_rec_name(cls, name, clause):
+        return [('reference',) + tuple(clause[1:])]
+
+    @classmethod
+    def update_amount(cls, slips):
+        "Set the amount of the slips to the total of their checks"
+        pool = Pool()
+        ThirdCheck = pool.get('account.third.check')
+        check = ThirdCheck.__table__()
+        cursor = Transaction().connection.cursor()
+
+        amounts = {}
+        for sub_slips in grouped_slice(slips):
+            cursor.execute(*check.select(
+                    check.deposit_slip, Sum(check.amount),
+                    where=check.deposit_slip.in_([s.id for s in sub_slips]),
+                    group_by=[check.deposit_slip]))
+            amounts.update(cursor)
+        to_write = defaultdict(list)
+        for slip in slips:
+            amount = slip.currency.round(
+                Decimal(str(amounts.get(slip.id) or 0)))
+            if amount != slip.amount:
+                to_write[amount].append(slip)
+        args = []
+        for amount, records in to_write.items():
+            args.extend((records, {'amount': amount}))
+        if args:
+            cls.write(*args)
+
+
 class AccountVoucherThirdCheck(ModelSQL):
     'Account Voucher - Account Third Check'
     __name__ = 'account.voucher-account.third.check'
@@ -453,6 +1093,141 @@ class AccountVoucherThirdCheck(ModelSQL):
         required=True, ondelete='CASCADE')
 
 
+class CheckStateLog(ModelSQL, ModelView):
+    'Check State Log'
+    __name__ = 'account.check.state.log'
+
+    check = fields.Reference('Check', [
+            ('account.issued.check', 'Issued Check'),
+            ('account.third.check', 'Third Check'),
+            ], required=True, readonly=True)
+    check_model = fields.Char('Check Model', readonly=True)
+    check_id = fields.Integer('Check ID', readonly=True)
+    date = fields.Date('Date', required=True, readonly=True)
+    from_state = fields.Selection('get_states', 'From State', readonly=True)
+    state = fields.Selection('get_states', 'State', required=True,
+        readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.update({
+            Index(t,
+                (t.check, Index.Equality()),
+                (t.date, Index.Range())),
+            Index(t,
+                (t.check_model, Index.Equality()),
+                (t.check_id, Index.Equality()),
+                (t.date, Index.Range())),
+            Index(t,
+                (t.state, Index.Equality()),
+                (t.date, Index.Range())),
+            })
+        cls._order = [
+            ('date', 'DESC'),
+            ('id', 'DESC'),
+            ]
+
+    @classmethod
+    def __register__(cls, module_name):
+        pool = Pool()
+        IssuedCheck = pool.get('account.issued.check')
+        ThirdCheck = pool.get('account.third.check')
+        table = cls.__table__()
+        cursor = Transaction().connection.cursor()
+
+        exist = backend.TableHandler.table_exist(cls._table)
+        fill_check = (exist
+            and not backend.TableHandler(cls, module_name).column_exist(
+                'check_id'))
+
+        super().__register__(module_name)
+
+        # Migration from 7.0: log the current state of existing checks
+        if not exist:
+            for Check, date in [
+                    (IssuedCheck, ('date_out', 'date')),
+                    (ThirdCheck, ('date_in', 'date')),
+                    ]:
+                check = Check.__table__()
+                cursor.execute(*table.insert(
+                        [table.create_uid, table.create_date,
+                            table.check, table.check_model, table.check_id,
+                            table.date, table.state],
+                        check.select(Literal(0), CurrentTimestamp(),
+                            Concat(Check.__name__ + ',', check.id),
+                            Literal(Check.__name__), check.id,
+                            Coalesce(*(getattr(check, d) for d in date)),
+                            check.state)))
+
+        # Migration from 7.0: split the check reference of the logs
+        if fill_check:
+            cursor.execute(*table.update(
+                    [table.check_model, table.check_id],
+                    [Substring(table.check,
+                            1, Position(',', table.check) - 1),
+                        cls.check.sql_id(table.check, cls)]))
+
+    @classmethod
+    def create(cls, vlist):
+        vlist = [v.copy() for v in vlist]
+        for values in vlist:
+            if values.get('check'):
+                check = values['check']
+                if isinstance(check, str):
+                    check = check.split(',')
+                model, id_ = check
+                values['check_model'] = model
+                values['check_id'] = int(id_)
+        return super().create(vlist)
+
+    @classmethod
+    def get_states(cls):
+        pool = Pool()
+        IssuedCheck = pool.get('account.issued.check')
+        ThirdCheck = pool.get('account.third.check')
+        states = [(None, '')]
+        for Check in [IssuedCheck, ThirdCheck]:
+            for state in Check.state.selection:
+                if state not in states:
+                    states.append(state)
+        return states
+
+    @classmethod
+    def write(cls, *args):
+        raise UserError(gettext('account_check_ar.msg_check_state_log_modify'))
+
+    @classmethod
+    def delete(cls, logs):
+        if logs:
+            raise UserError(
+                gettext('account_check_ar.msg_check_state_log_modify'))
+
+    @classmethod
+    def get_states_at(cls, checks, date):
+        "Return a dictionary of check and its state at the date"
+        cursor = Transaction().connection.cursor()
+        table = cls.__table__()
+
+        result = {}
+        for sub_checks in grouped_slice(checks):
+            check2record = {str(c): c for c in sub_checks}
+            # The logs may be backdated so the last one is the greatest
+            # date and then the greatest id
+            last = table.select(table.check, table.state,
+                RowNumber(window=Window([table.check],
+                        order_by=[table.date.desc, table.id.desc])
+                    ).as_('rank'),
+                where=table.check.in_(list(check2record))
+                & (table.date <= date))
+            cursor.execute(*last.select(last.check, last.state,
+                    where=last.rank == 1))
+            for check, state in cursor:
+                result[check2record[check]] = state
+        return result
+
+
 class Journal(ModelSQL, ModelView):
     __name__ = 'account.journal'
 
@@ -472,6 +1247,255 @@ class Journal(ModelSQL, ModelView):
             ('closed', '!=', True),
             ])
 
+    @classmethod
+    def write(cls, *args):
+        super().write(*args)
+        clear_lookups()
+
+    @classmethod
+    def delete(cls, journals):
+        super().delete(journals)
+        clear_lookups()
+
+
+class BankAccount(metaclass=PoolMeta):
+    __name__ = 'bank.account'
+
+    @classmethod
+    def write(cls, *args):
+        super().write(*args)
+        clear_lookups()
+
+    @classmethod
+    def delete(cls, accounts):
+        super().delete(accounts)
+        clear_lookups()
+
+
+class Period(metaclass=PoolMeta):
+    __name__ = 'account.period'
+
+    @classmethod
+    def create(cls, vlist):
+        periods = super().create(vlist)
+        clear_lookups()
+        return periods
+
+    @classmethod
+    def write(cls, *args):
+        super().write(*args)
+        clear_lookups()
+
+    @classmethod
+    def delete(cls, periods):
+        super().delete(periods)
+        clear_lookups()
+
+
+class Cron(metaclass=PoolMeta):
+    __name__ = 'ir.cron'
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls.method.selection.append(
+            ('account.issued.check|debit_matured',
+                "Debit Matured Issued Checks"))
+
+
+class CheckMoveWizardMixin:
+    'Mixin to create the moves of check wizards in batch'
+    __slots__ = ()
+    # The check field storing the created move
+    _check_move_field = None
+    # The check field storing the move to cancel on revert
+    _revert_move_field = None
+
+    @cached_property
+    def move_date(self):
+        return self.start.date
+
+    @cached_property
+    def move_period(self):
+        company = Transaction().context.get('company')
+        return find_period(company, self.move_date)
+
+    def validate_check(self, check):
+        "Raise an error if the check can not be processed"
+        if check.queue_state == 'queued':
+            raise UserError(gettext(
+                    'account_check_ar.msg_check_queued', check=check.name))
+
+    def get_moves(self, checks):
+        """Return a list of (checks, move values) tuples
+
+        By default a move is created for each check from the values with
+        its 'lines' returned by the get_move method of the wizard."""
+        return [([check], self.get_move(check)) for check in checks]
+
+    def get_check_values(self, check):
+        "Return the values to write on the check"
+        return {}
+
+    def enqueue_check_moves(self, Check, checks, transition):
+        """Validate the checks and create their moves in background
+
+        The moves are created by chunks of checks, each in its own
+        transaction.
+        """
+        checks = list(checks)
+        for check in checks:
+            self.validate_check(check)
+        start = {}
+        for name, field in self.start._fields.items():
+            if name == 'id' or hasattr(field, 'getter'):
+                continue
+            value = getattr(self.start, name, None)
+            start[name] = value.id if isinstance(value, Model) else value
+        start['background'] = False
+        Check.enqueue_wizard(checks, self.__name__, transition, start)
+
+    def get_moves_to_cancel(self, Check, checks):
+        """Return a dictionary of move to cancel and checks and the checks
+        without such move
+
+        A move is cancelled only if all its checks are reverted together and
+        none of them has already been countered by a move from its origin.
+        """
+        Move = Pool().get('account.move')
+        field = self._revert_move_field
+        if not field:
+            return {}, checks
+        move2checks = defaultdict(list)
+        for check in checks:
+            move = getattr(check, field)
+            if move:
+                move2checks[move].append(check)
+        check_ids = {c.id for c in checks}
+        for sub_moves in grouped_slice(list(move2checks)):
+            for check in Check.search([
+                        (field, 'in', [m.id for m in sub_moves]),
+                        ]):
+                if check.id not in check_ids:
+                    move2checks.pop(getattr(check, field), None)
+        for sub_moves in grouped_slice(list(move2checks)):
+            for move in Move.search([
+                        ('origin', 'in', [str(m) for m in sub_moves]),
+                        ]):
+                move2checks.pop(move.origin, None)
+        return move2checks, [c for c in checks
+            if getattr(c, field) not in move2checks]
+
+    def get_cancel_default(self):
+        "Return the default values to copy the moves as their reversal"
+        return {
+            'origin': lambda data: 'account.move,%s' % data['id'],
+            'date': self.move_date,
+            'period': self.move_period.id,
+            'lines.debit': lambda data: data['credit'],
+            'lines.credit': lambda data: data['debit'],
+            'lines.amount_second_currency': (
+                lambda data: data['amount_second_currency'] * -1
+                if data['amount_second_currency']
+                else data['amount_second_currency']),
+            'lines.tax_lines.amount': lambda data: data['amount'] * -1,
+            'lines.origin': (
+                lambda data: 'account.move.line,%s' % data['id']),
+            }
+
+    def cancel_check_moves(self, moves):
+        """Copy the moves as their reversal with a single call
+
+        Return the cancel moves and the lists of lines to reconcile.
+        The lines already reconciled are kept so only the groups which
+        balance are returned.
+        """
+        Move = Pool().get('account.move')
+
+        cancel_moves = Move.copy(moves, default=self.get_cancel_default())
+        to_reconcile = defaultdict(list)
+        for move, cancel_move in zip(moves, cancel_moves):
+            for line in move.lines + cancel_move.lines:
+                if line.account.reconcile and not line.reconciliation:
+                    to_reconcile[
+                        (move, line.account, line.party)].append(line)
+        return cancel_moves, [lines for lines in to_reconcile.values()
+            if len(lines) > 1
+            and not sum(line.debit - line.credit for line in lines)]
+
+    def _get_check_write_values(self, check, move=None):
+        values = self.get_check_values(check)
+        # Processed checks are released from a failed background run
+        values['queue_state'] = None
+        if self._check_move_field and move:
+            values[self._check_move_field] = move.id
+        if self._revert_move_field:
+            values[self._revert_move_field] = None
+        return tuple(sorted(values.items()))
+
+    def create_check_moves(self, Check, checks):
+        """Validate the checks and create, post their moves in batch
+
+        The moves and their lines are created with a single call each, the
+        checks are written with one grouped call and the moves are posted at
+        once. On revert, the moves which put the checks in their state are
+        cancelled when possible instead of creating new moves.
+        """
+        pool = Pool()
+        Move = pool.get('account.move')
+        MoveLine = pool.get('account.move.line')
+
+        checks = list(checks)
+        for check in checks:
+            self.validate_check(check)
+        to_cancel, checks = self.get_moves_to_cancel(Check, checks)
+
+        moves_checks, moves_values, moves_lines = [], [], []
+        for move_checks, values in self.get_moves(checks):
+            values = values.copy()
+            if self._revert_move_field:
+                # Record the counter-move on the move it reverts partially
+                origins = {getattr(c, self._revert_move_field)
+                    for c in move_checks}
+                if len(origins) == 1 and None not in origins:
+                    values.setdefault('origin', str(origins.pop()))
+            moves_lines.append(values.pop('lines'))
+            moves_values.append(values)
+            moves_checks.append(move_checks)
+        moves = Move.create(moves_values)
+
+        lines = []
+        to_write = defaultdict(list)
+        for move, move_checks, move_lines in zip(
+                moves, moves_checks, moves_lines):
+            for line in move_lines:
+                lines.append({**line, 'move': move.id})
+            for check in move_checks:
+                to_write[self._get_check_write_values(check, move)].append(
+                    check)
+        MoveLine.create(lines)
+
+        to_reconcile = []
+        if to_cancel:
+            cancel_moves, to_reconcile = self.cancel_check_moves(
+                list(to_cancel))
+            moves += cancel_moves
+            for move_checks in to_cancel.values():
+                for check in move_checks:
+                    to_write[self._get_check_write_values(check)].append(
+                        check)
+        add_moves(moves)
+        args = []
+        for values, records in to_write.items():
+            args.extend((records, dict(values)))
+        if args:
+            with Transaction().set_context(check_state_date=self.move_date):
+                Check.write(*args)
+        Move.post(moves)
+        if to_reconcile:
+            MoveLine.reconcile(*to_reconcile)
+        return moves
+
 
 class ThirdCheckHeldStart(ModelView):
     'Third Check Held'
@@ -484,11 +1508,14 @@ class ThirdCheckHeldStart(ModelView):
             ('closed', '!=', True),
             ('company', '=', Eval('context', {}).get('company', -1)),
             ])
+    background = fields.Boolean('Run in Background',
+        help="Create the moves in background by chunks of checks.")
 
 
-class ThirdCheckHeld(Wizard):
+class ThirdCheckHeld(CheckMoveWizardMixin, Wizard):
     'Third Check Held'
     __name__ = 'account.third.check.held'
+    _check_move_field = 'held_move'
 
     start = StateView('account.third.check.held.start',
         'account_check_ar.view_third_check_held', [
@@ -497,55 +1524,56 @@ class ThirdCheckHeld(Wizard):
             ])
     held = StateTransition()
 
-    def transition_held(self):
-        pool = Pool()
-        ThirdCheck = pool.get('account.third.check')
-        Move = pool.get('account.move')
-        MoveLine = pool.get('account.move.line')
-        Date = pool.get('ir.date')
-        Period = pool.get('account.period')
+    @cached_property
+    def move_date(self):
+        Date = Pool().get('ir.date')
+        return Date.today()
 
-        company = Transaction().context.get('company')
-        date = Date.today()
-        period = Period.find(company, date=date)
-        for check in self.records:
-            if check.state != 'draft':
-                raise UserError(gettext(
-                    'account_check_ar.msg_check_not_draft', check=check.name))
-            if not self.start.journal.third_check_account:
-                raise UserError(gettext(
-                    'account_voucher_ar.msg_no_journal_check_account',
-                    journal=self.start.journal.name))
+    def validate_check(self, check):
+        super().validate_check(check)
+        if check.state != 'draft':
+            raise UserError(gettext(
+                'account_check_ar.msg_check_not_draft', check=check.name))
+        if not lookup(self.start.journal, 'third_check_account'):
+            raise UserError(gettext(
+                'account_voucher_ar.msg_no_journal_check_account',
+                journal=self.start.journal.name))
+
+    def get_move(self, check):
+        journal = self.start.journal
+        return {
+            'journal': journal.id,
+            'period': self.move_period.id,
+            'date': self.move_date,
+            'description': 'Cheque: ' + check.name,
+            'lines': [{
+                    'account': lookup(journal, 'third_check_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': check.amount,
+                    'credit': _ZERO,
+                    'date': self.move_date,
+                    'maturity_date': check.date,
+                    }, {
+                    'account': self.start.credit_account.id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': _ZERO,
+                    'credit': check.amount,
+                    'date': self.move_date,
+                    }],
+            }
 
-            move, = Move.create([{
-                'journal': self.start.journal.id,
-                'period': period.id,
-                'date': date,
-                'description': 'Cheque: ' + check.name,
-                }])
-            lines = []
-            lines.append({
-                'account': self.start.journal.third_check_account.id,
-                'move': move.id,
-                'journal': self.start.journal.id,
-                'period': period.id,
-                'debit': check.amount,
-                'credit': _ZERO,
-                'date': date,
-                'maturity_date': check.date,
-                })
-            lines.append({
-                'account': self.start.credit_account.id,
-                'move': move.id,
-                'journal': self.start.journal.id,
-                'period': period.id,
-                'debit': _ZERO,
-                'credit': check.amount,
-                'date': date,
-                })
-            MoveLine.create(lines)
-            ThirdCheck.write([check], {'state': 'held'})
-            Move.post([move])
+    def get_check_values(self, check):
+        return {'state': 'held'}
+
+    @instrumented
+    def transition_held(self):
+        ThirdCheck = Pool().get('account.third.check')
+        if self.start.background:
+            self.enqueue_check_moves(ThirdCheck, self.records, 'held')
+        else:
+            self.create_check_moves(ThirdCheck, self.records)
         return 'end'
 
 
@@ -556,16 +1584,33 @@ class ThirdCheckDepositStart(ModelView):
     bank_account = fields.Many2One('bank.account', 'Bank Account',
         required=True)
     date = fields.Date('Date', required=True)
+    grouping = fields.Selection([
+        ('check', 'One Move per Check'),
+        ('deposit', 'One Move per Deposit'),
+        ('summary', 'One Move per Deposit (summarized)'),
+        ], 'Move Grouping', required=True)
+    reference = fields.Char('Reference',
+        help="The number of the deposit slip of the bank.")
+    background = fields.Boolean('Run in Background',
+        states={'invisible': Eval('grouping') != 'check'},
+        help="Create the moves in background by chunks of checks.")
+    slip = fields.Many2One('account.third.check.deposit.slip', 'Deposit Slip',
+        readonly=True)
 
     @staticmethod
     def default_date():
         Date = Pool().get('ir.date')
         return Date.today()
 
+    @staticmethod
+    def default_grouping():
+        return 'check'
+
 
-class ThirdCheckDeposit(Wizard):
+class ThirdCheckDeposit(CheckMoveWizardMixin, Wizard):
     'Third Check Deposit'
     __name__ = 'account.third.check.deposit'
+    _check_move_field = 'deposit_move'
 
     start = StateView('account.third.check.deposit.start',
         'account_check_ar.view_third_check_deposit', [
@@ -574,58 +1619,111 @@ class ThirdCheckDeposit(Wizard):
             ])
     deposit = StateTransition()
 
+    def validate_check(self, check):
+        super().validate_check(check)
+        if check.state not in ['held', 'reverted']:
+            raise UserError(gettext(
+                'account_check_ar.msg_check_not_held',
+                check=check.name))
+        if not lookup(self.start.bank_account, 'journal.third_check_account'):
+            raise UserError(gettext(
+                'account_voucher_ar.msg_no_journal_check_account',
+                journal=self.start.bank_account.journal.name))
+
+    def get_moves(self, checks):
+        if self.start.grouping == 'check':
+            return super().get_moves(checks)
+        if not checks:
+            return []
+        return [(checks, self.get_deposit_move(checks))]
+
+    def _get_line(self, account, debit=_ZERO, credit=_ZERO, **values):
+        journal = lookup(self.start.bank_account, 'journal')
+        values.update({
+                'account': account.id,
+                'journal': journal.id,
+                'period': self.move_period.id,
+                'debit': debit,
+                'credit': credit,
+                'date': self.move_date,
+                })
+        return values
+
+    def get_move(self, check):
+        bank_account = self.start.bank_account
+        journal = lookup(bank_account, 'journal')
+        return {
+            'journal': journal.id,
+            'period': self.move_period.id,
+            'date': self.move_date,
+            'description': 'Cheque: ' + check.name,
+            'lines': [
+                self._get_line(lookup(bank_account, 'debit_account'),
+                    debit=check.amount),
+                self._get_line(lookup(journal, 'third_check_account'),
+                    credit=check.amount),
+                ],
+            }
+
+    def get_deposit_move(self, checks):
+        "Return the values of a single move for all the checks"
+        bank_account = self.start.bank_account
+        journal = lookup(bank_account, 'journal')
+        check_account = lookup(journal, 'third_check_account')
+        total = sum((c.amount for c in checks), _ZERO)
+        lines = [self._get_line(
+                lookup(bank_account, 'debit_account'), debit=total)]
+        if self.start.grouping == 'summary':
+            lines.append(self._get_line(check_account, credit=total))
+        else:
+            for check in checks:
+                lines.append(self._get_line(check_account,
+                        credit=check.amount,
+                        description='Cheque: ' + check.name))
+        return {
+            'journal': journal.id,
+            'period': self.move_period.id,
+            'date': self.move_date,
+            'description': 'Depósito Cheques: ' + ', '.join(
+                check.name for check in checks),
+            'lines': lines,
+            }
+
+    def get_check_values(self, check):
+        return {
+            'account_bank_out': self.start.bank_account.id,
+            'deposit_slip': self.start.slip.id,
+            'state': 'deposited',
+            }
+
+    def get_deposit_slip(self, checks):
+        "Return the values of the deposit slip of the checks"
+        bank_account = self.start.bank_account
+        return {
+            'reference': self.start.reference,
+            'date': self.start.date,
+            'bank_account': bank_account.id,
+            'currency': bank_account.currency.id,
+            'amount': sum((c.amount for c in checks), _ZERO),
+            }
+
+    @instrumented
     def transition_deposit(self):
         pool = Pool()
         ThirdCheck = pool.get('account.third.check')
-        Move = pool.get('account.move')
-        MoveLine = pool.get('account.move.line')
-        Period = pool.get('account.period')
-
-        company = Transaction().context.get('company')
-        period = Period.find(company, date=self.start.date)
-        for check in self.records:
-            if check.state not in ['held', 'reverted']:
-                raise UserError(gettext(
-                    'account_check_ar.msg_check_not_held',
-                    check=check.name))
-            if not self.start.bank_account.journal.third_check_account:
-                raise UserError(gettext(
-                    'account_voucher_ar.msg_no_journal_check_account',
-                    journal=self.start.bank_account.journal.name))
-
-            move, = Move.create([{
-                'journal': self.start.bank_account.journal.id,
-                'period': period.id,
-                'date': self.start.date,
-                'description': 'Cheque: ' + check.name,
-                }])
-            lines = []
-            lines.append({
-                'account':
-                    self.start.bank_account.debit_account.id,
-                'move': move.id,
-                'journal': self.start.bank_account.journal.id,
-                'period': period.id,
-                'debit': check.amount,
-                'credit': _ZERO,
-                'date': self.start.date,
-                })
-            lines.append({
-                'account':
-                    self.start.bank_account.journal.third_check_account.id,
-                'move': move.id,
-                'journal': self.start.bank_account.journal.id,
-                'period': period.id,
-                'debit': _ZERO,
-                'credit': check.amount,
-                'date': self.start.date,
-                })
-            MoveLine.create(lines)
-            ThirdCheck.write([check], {
-                'account_bank_out': self.start.bank_account.id,
-                'state': 'deposited',
-                })
-            Move.post([move])
+        Slip = pool.get('account.third.check.deposit.slip')
+
+        # The slip is already created when running a background chunk
+        if not self.start.slip:
+            self.start.slip, = Slip.create(
+                [self.get_deposit_slip(self.records)])
+        if self.start.background and self.start.grouping == 'check':
+            self.enqueue_check_moves(ThirdCheck, self.records, 'deposit')
+        else:
+            moves = self.create_check_moves(ThirdCheck, self.records)
+            if self.start.grouping != 'check' and moves:
+                move, = moves
+                Slip.write([self.start.slip], {'move': move.id})
         return 'end'
 
 
@@ -641,9 +1739,10 @@ class ThirdCheckRevertDepositStart(ModelView):
         return Date.today()
 
 
-class ThirdCheckRevertDeposit(Wizard):
+class ThirdCheckRevertDeposit(CheckMoveWizardMixin, Wizard):
     'Revert Third Check Deposit'
     __name__ = 'account.third.check.revert_deposit'
+    _revert_move_field = 'deposit_move'
 
     start = StateView('account.third.check.revert_deposit.start',
         'account_check_ar.view_third_check_revert_deposit', [
@@ -652,58 +1751,58 @@ class ThirdCheckRevertDeposit(Wizard):
             ])
     revert = StateTransition()
 
+    def validate_check(self, check):
+        super().validate_check(check)
+        if check.state not in ['deposited', 'delivered']:
+            raise UserError(gettext(
+                'account_check_ar.msg_check_not_deposited',
+                check=check.name))
+        if not lookup(check.account_bank_out, 'journal.third_check_account'):
+            raise UserError(gettext(
+                'account_voucher_ar.msg_no_journal_check_account',
+                journal=check.account_bank_out.journal.name))
+
+    def get_move(self, check):
+        bank_account = check.account_bank_out
+        journal = lookup(bank_account, 'journal')
+        return {
+            'journal': journal.id,
+            'period': self.move_period.id,
+            'date': self.move_date,
+            'description': 'Cheque: ' + check.name,
+            'lines': [{
+                    'account': lookup(bank_account, 'debit_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': _ZERO,
+                    'credit': check.amount,
+                    'date': self.move_date,
+                    }, {
+                    'account': lookup(journal, 'third_check_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': check.amount,
+                    'credit': _ZERO,
+                    'date': self.move_date,
+                    }],
+            }
+
+    def get_check_values(self, check):
+        return {
+            'account_bank_out': None,
+            'deposit_slip': None,
+            'state': 'reverted',
+            }
+
+    @instrumented
     def transition_revert(self):
         pool = Pool()
         ThirdCheck = pool.get('account.third.check')
-        Move = pool.get('account.move')
-        MoveLine = pool.get('account.move.line')
-        Period = pool.get('account.period')
-
-        company = Transaction().context.get('company')
-        period = Period.find(company, date=self.start.date)
-        for check in self.records:
-            if check.state not in ['deposited', 'delivered']:
-                raise UserError(gettext(
-                    'account_check_ar.msg_check_not_deposited',
-                    check=check.name))
-            if not check.account_bank_out.journal.third_check_account:
-                raise UserError(gettext(
-                    'account_voucher_ar.msg_no_journal_check_account',
-                    journal=check.account_bank_out.journal.name))
-
-            move, = Move.create([{
-                'journal': check.account_bank_out.journal.id,
-                'period': period.id,
-                'date': self.start.date,
-                'description': 'Cheque: ' + check.name,
-                }])
-            lines = []
-            lines.append({
-                'account':
-                    check.account_bank_out.debit_account.id,
-                'move': move.id,
-                'journal': check.account_bank_out.journal.id,
-                'period': period.id,
-                'debit': _ZERO,
-                'credit': check.amount,
-                'date': self.start.date,
-                })
-            lines.append({
-                'account':
-                    check.account_bank_out.journal.third_check_account.id,
-                'move': move.id,
-                'journal': check.account_bank_out.journal.id,
-                'period': period.id,
-                'debit': check.amount,
-                'credit': _ZERO,
-                'date': self.start.date,
-                })
-            MoveLine.create(lines)
-            ThirdCheck.write([check], {
-                'account_bank_out': None,
-                'state': 'reverted',
-                })
-            Move.post([move])
+        Slip = pool.get('account.third.check.deposit.slip')
+        slips = list({c.deposit_slip for c in self.records if c.deposit_slip})
+        self.create_check_moves(ThirdCheck, self.records)
+        if slips:
+            Slip.update_amount(slips)
         return 'end'
 
 
@@ -714,11 +1813,14 @@ class IssuedCheckDebitStart(ModelView):
     bank_account = fields.Many2One('bank.account', 'Bank Account',
         required=True)
     date = fields.Date('Date', required=True)
+    background = fields.Boolean('Run in Background',
+        help="Create the moves in background by chunks of checks.")
 
 
-class IssuedCheckDebit(Wizard):
+class IssuedCheckDebit(CheckMoveWizardMixin, Wizard):
     'Issued Check Debit'
     __name__ = 'account.issued.check.debit'
+    _check_move_field = 'debit_move'
 
     start = StateView('account.issued.check.debit.start',
         'account_check_ar.view_issued_check_debit', [
@@ -734,54 +1836,52 @@ class IssuedCheckDebit(Wizard):
             'date': Date.today(),
             }
 
-    def transition_debit(self):
-        pool = Pool()
-        IssuedCheck = pool.get('account.issued.check')
-        Move = pool.get('account.move')
-        MoveLine = pool.get('account.move.line')
-        Period = pool.get('account.period')
+    def validate_check(self, check):
+        super().validate_check(check)
+        if check.state != 'issued':
+            raise UserError(gettext(
+                'account_check_ar.msg_check_not_issued',
+                check=check.name))
+        if not lookup(self.start.bank_account, 'journal.issued_check_account'):
+            raise UserError(gettext(
+                'account_voucher_ar.msg_no_journal_check_account',
+                journal=self.start.bank_account.journal.name))
+
+    def get_move(self, check):
+        bank_account = self.start.bank_account
+        journal = lookup(bank_account, 'journal')
+        return {
+            'journal': journal.id,
+            'period': self.move_period.id,
+            'date': self.move_date,
+            'description': 'Cheque: ' + check.name,
+            'lines': [{
+                    'account': lookup(journal, 'issued_check_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': check.amount,
+                    'credit': _ZERO,
+                    'date': self.move_date,
+                    }, {
+                    'account': lookup(bank_account, 'debit_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': _ZERO,
+                    'credit': check.amount,
+                    'date': self.move_date,
+                    }],
+            }
 
-        company = Transaction().context.get('company')
-        period = Period.find(company, date=self.start.date)
-        for check in self.records:
-            if check.state != 'issued':
-                raise UserError(gettext(
-                    'account_check_ar.msg_check_not_issued',
-                    check=check.name))
-            if not self.start.bank_account.journal.issued_check_account:
-                raise UserError(gettext(
-                    'account_voucher_ar.msg_no_journal_check_account',
-                    journal=self.start.bank_account.journal.name))
-
-            move, = Move.create([{
-                'journal': self.start.bank_account.journal.id,
-                'period': period.id,
-                'date': self.start.date,
-                'description': 'Cheque: ' + check.name,
-                }])
-            lines = []
-            lines.append({
-                'account':
-                    self.start.bank_account.journal.issued_check_account.id,
-                'move': move.id,
-                'journal': self.start.bank_account.journal.id,
-                'period': period.id,
-                'debit': check.amount,
-                'credit': _ZERO,
-                'date': self.start.date,
-                })
-            lines.append({
-                'account': self.start.bank_account.debit_account.id,
-                'move': move.id,
-                'journal': self.start.bank_account.journal.id,
-                'period': period.id,
-                'debit': _ZERO,
-                'credit': check.amount,
-                'date': self.start.date,
-                })
-            MoveLine.create(lines)
-            IssuedCheck.write([check], {'state': 'debited'})
-            Move.post([move])
+    def get_check_values(self, check):
+        return {'state': 'debited'}
+
+    @instrumented
+    def transition_debit(self):
+        IssuedCheck = Pool().get('account.issued.check')
+        if self.start.background:
+            self.enqueue_check_moves(IssuedCheck, self.records, 'debit')
+        else:
+            self.create_check_moves(IssuedCheck, self.records)
         return 'end'
 
 
@@ -797,9 +1897,10 @@ class IssuedCheckRevertDebitStart(ModelView):
         return date_obj.today()
 
 
-class IssuedCheckRevertDebit(Wizard):
+class IssuedCheckRevertDebit(CheckMoveWizardMixin, Wizard):
     'Revert Issued Check Debit'
     __name__ = 'account.issued.check.revert_debit'
+    _revert_move_field = 'debit_move'
 
     start = StateView('account.issued.check.revert_debit.start',
         'account_check_ar.view_issued_check_revert_debit', [
@@ -808,54 +1909,49 @@ class IssuedCheckRevertDebit(Wizard):
             ])
     revert = StateTransition()
 
-    def transition_revert(self):
-        pool = Pool()
-        IssuedCheck = pool.get('account.issued.check')
-        Move = pool.get('account.move')
-        MoveLine = pool.get('account.move.line')
-        Period = pool.get('account.period')
+    def validate_check(self, check):
+        super().validate_check(check)
+        if check.state != 'debited':
+            raise UserError(gettext(
+                'account_check_ar.msg_check_not_debited',
+                check=check.name))
+        if not lookup(check.bank_account, 'journal.issued_check_account'):
+            raise UserError(gettext(
+                'account_voucher_ar.msg_no_journal_check_account',
+                journal=check.bank_account.journal.name))
+
+    def get_move(self, check):
+        bank_account = check.bank_account
+        journal = lookup(bank_account, 'journal')
+        return {
+            'journal': journal.id,
+            'period': self.move_period.id,
+            'date': self.move_date,
+            'description': 'Cheque: ' + check.name,
+            'lines': [{
+                    'account': lookup(journal, 'issued_check_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': _ZERO,
+                    'credit': check.amount,
+                    'date': self.move_date,
+                    }, {
+                    'account': lookup(bank_account, 'debit_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': check.amount,
+                    'credit': _ZERO,
+                    'date': self.move_date,
+                    }],
+            }
 
-        company = Transaction().context.get('company')
-        period = Period.find(company, date=self.start.date)
-        for check in self.records:
-            if check.state != 'debited':
-                raise UserError(gettext(
-                    'account_check_ar.msg_check_not_debited',
-                    check=check.name))
-            if not check.bank_account.journal.issued_check_account:
-                raise UserError(gettext(
-                    'account_voucher_ar.msg_no_journal_check_account',
-                    journal=check.bank_account.journal.name))
-
-            move, = Move.create([{
-                'journal': check.bank_account.journal.id,
-                'period': period.id,
-                'date': self.start.date,
-                'description': 'Cheque: ' + check.name,
-                }])
-            lines = []
-            lines.append({
-                'account':
-                    check.bank_account.journal.issued_check_account.id,
-                'move': move.id,
-                'journal': check.bank_account.journal.id,
-                'period': period.id,
-                'debit': _ZERO,
-                'credit': check.amount,
-                'date': self.start.date,
-                })
-            lines.append({
-                'account': check.bank_account.debit_account.id,
-                'move': move.id,
-                'journal': check.bank_account.journal.id,
-                'period': period.id,
-                'debit': check.amount,
-                'credit': _ZERO,
-                'date': self.start.date,
-                })
-            MoveLine.create(lines)
-            IssuedCheck.write([check], {'state': 'issued'})
-            Move.post([move])
+    def get_check_values(self, check):
+        return {'state': 'issued'}
+
+    @instrumented
+    def transition_revert(self):
+        IssuedCheck = Pool().get('account.issued.check')
+        self.create_check_moves(IssuedCheck, self.records)
         return 'end'
 
 
@@ -866,9 +1962,10 @@ class ThirdCheckRejectStart(ModelView):
     journal = fields.Many2One('account.journal', 'Journal', required=True)
 
 
-class ThirdCheckReject(Wizard):
+class ThirdCheckReject(CheckMoveWizardMixin, Wizard):
     'Third Check Reject'
     __name__ = 'account.third.check.reject'
+    _check_move_field = 'reject_move'
 
     start = StateView('account.third.check.reject.start',
         'account_check_ar.view_third_check_reject', [
@@ -877,56 +1974,54 @@ class ThirdCheckReject(Wizard):
             ])
     reject = StateTransition()
 
-    def transition_reject(self):
-        pool = Pool()
-        ThirdCheck = pool.get('account.third.check')
-        Move = pool.get('account.move')
-        MoveLine = pool.get('account.move.line')
-        Date = pool.get('ir.date')
-        Period = pool.get('account.period')
+    @cached_property
+    def move_date(self):
+        Date = Pool().get('ir.date')
+        return Date.today()
 
-        company = Transaction().context.get('company')
-        date = Date.today()
-        period = Period.find(company, date=date)
-        for check in self.records:
-            if check.state not in ['held', 'reverted']:
-                raise UserError(gettext(
-                    'account_check_ar.msg_check_not_held',
-                    check=check.name))
-            if (not self.start.journal.third_check_account or
-                    not self.start.journal.rejected_check_account):
-                raise UserError(gettext(
-                    'account_voucher_ar.msg_no_journal_check_account',
-                    journal=self.start.journal.name))
+    def validate_check(self, check):
+        super().validate_check(check)
+        if check.state not in ['held', 'reverted']:
+            raise UserError(gettext(
+                'account_check_ar.msg_check_not_held',
+                check=check.name))
+        if (not lookup(self.start.journal, 'third_check_account') or
+                not lookup(self.start.journal, 'rejected_check_account')):
+            raise UserError(gettext(
+                'account_voucher_ar.msg_no_journal_check_account',
+                journal=self.start.journal.name))
+
+    def get_move(self, check):
+        journal = self.start.journal
+        return {
+            'journal': journal.id,
+            'period': self.move_period.id,
+            'date': self.move_date,
+            'description': 'Cheque: ' + check.name,
+            'lines': [{
+                    'account': lookup(journal, 'rejected_check_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': check.amount,
+                    'credit': _ZERO,
+                    'date': self.move_date,
+                    }, {
+                    'account': lookup(journal, 'third_check_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': _ZERO,
+                    'credit': check.amount,
+                    'date': self.move_date,
+                    }],
+            }
 
-            move, = Move.create([{
-                'journal': self.start.journal.id,
-                'period': period.id,
-                'date': date,
-                'description': 'Cheque: ' + check.name,
-                }])
-            lines = []
-            lines.append({
-                'account': self.start.journal.rejected_check_account.id,
-                'move': move.id,
-                'journal': self.start.journal.id,
-                'period': period.id,
-                'debit': check.amount,
-                'credit': _ZERO,
-                'date': date,
-                })
-            lines.append({
-                'account': self.start.journal.third_check_account.id,
-                'move': move.id,
-                'journal': self.start.journal.id,
-                'period': period.id,
-                'debit': _ZERO,
-                'credit': check.amount,
-                'date': date,
-                })
-            MoveLine.create(lines)
-            ThirdCheck.write([check], {'state': 'rejected'})
-            Move.post([move])
+    def get_check_values(self, check):
+        return {'state': 'rejected'}
+
+    @instrumented
+    def transition_reject(self):
+        ThirdCheck = Pool().get('account.third.check')
+        self.create_check_moves(ThirdCheck, self.records)
         return 'end'
 
 
@@ -937,9 +2032,10 @@ class ThirdCheckRevertRejectStart(ModelView):
     journal = fields.Many2One('account.journal', 'Journal', required=True)
 
 
-class ThirdCheckRevertReject(Wizard):
+class ThirdCheckRevertReject(CheckMoveWizardMixin, Wizard):
     'Revert Third Check Reject'
     __name__ = 'account.third.check.revert_reject'
+    _revert_move_field = 'reject_move'
 
     start = StateView('account.third.check.revert_reject.start',
         'account_check_ar.view_third_check_revert_reject', [
@@ -948,56 +2044,54 @@ class ThirdCheckRevertReject(Wizard):
             ])
     revert = StateTransition()
 
-    def transition_revert(self):
-        pool = Pool()
-        ThirdCheck = pool.get('account.third.check')
-        Move = pool.get('account.move')
-        MoveLine = pool.get('account.move.line')
-        Date = pool.get('ir.date')
-        Period = pool.get('account.period')
+    @cached_property
+    def move_date(self):
+        Date = Pool().get('ir.date')
+        return Date.today()
 
-        company = Transaction().context.get('company')
-        date = Date.today()
-        period = Period.find(company, date=date)
-        for check in self.records:
-            if check.state != 'rejected':
-                raise UserError(gettext(
-                    'account_check_ar.msg_check_not_rejected',
-                    check=check.name))
-            if (not self.start.journal.third_check_account or
-                    not self.start.journal.rejected_check_account):
-                raise UserError(gettext(
-                    'account_voucher_ar.msg_no_journal_check_account',
-                    journal=self.start.journal.name))
+    def validate_check(self, check):
+        super().validate_check(check)
+        if check.state != 'rejected':
+            raise UserError(gettext(
+                'account_check_ar.msg_check_not_rejected',
+                check=check.name))
+        if (not lookup(self.start.journal, 'third_check_account') or
+                not lookup(self.start.journal, 'rejected_check_account')):
+            raise UserError(gettext(
+                'account_voucher_ar.msg_no_journal_check_account',
+                journal=self.start.journal.name))
+
+    def get_move(self, check):
+        journal = self.start.journal
+        return {
+            'journal': journal.id,
+            'period': self.move_period.id,
+            'date': self.move_date,
+            'description': 'Cheque: ' + check.name,
+            'lines': [{
+                    'account': lookup(journal, 'rejected_check_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': _ZERO,
+                    'credit': check.amount,
+                    'date': self.move_date,
+                    }, {
+                    'account': lookup(journal, 'third_check_account').id,
+                    'journal': journal.id,
+                    'period': self.move_period.id,
+                    'debit': check.amount,
+                    'credit': _ZERO,
+                    'date': self.move_date,
+                    }],
+            }
 
-            move, = Move.create([{
-                'journal': self.start.journal.id,
-                'period': period.id,
-                'date': date,
-                'description': 'Cheque: ' + check.name,
-                }])
-            lines = []
-            lines.append({
-                'account': self.start.journal.rejected_check_account.id,
-                'move': move.id,
-                'journal': self.start.journal.id,
-                'period': period.id,
-                'debit': _ZERO,
-                'credit': check.amount,
-                'date': date,
-                })
-            lines.append({
-                'account': self.start.journal.third_check_account.id,
-                'move': move.id,
-                'journal': self.start.journal.id,
-                'period': period.id,
-                'debit': check.amount,
-                'credit': _ZERO,
-                'date': date,
-                })
-            MoveLine.create(lines)
-            ThirdCheck.write([check], {'state': 'reverted'})
-            Move.post([move])
+    def get_check_values(self, check):
+        return {'state': 'reverted'}
+
+    @instrumented
+    def transition_revert(self):
+        ThirdCheck = Pool().get('account.third.check')
+        self.create_check_moves(ThirdCheck, self.records)
         return 'end'
 
 
@@ -1064,15 +2158,15 @@ class IssuedCheckCash(Wizard):
             ])
     cash = StateTransition()
 
+    @instrumented
     def transition_cash(self):
         pool = Pool()
         IssuedCheck = pool.get('account.issued.check')
         Move = pool.get('account.move')
         MoveLine = pool.get('account.move.line')
-        Period = pool.get('account.period')
 
         company = Transaction().context.get('company')
-        period = Period.find(company, date=self.start.date)
+        period = find_period(company, self.start.date)
         checkbook = self.start.checkbook
         number = self.start.number
         if checkbook.sequence.number_next == int(number):
@@ -1095,7 +2189,7 @@ class IssuedCheckCash(Wizard):
                     gettext('account_check_ar.msg_check_already_exists',
                         number=number))
         check, = IssuedCheck.create([{
-            'name': number and number or checkbook.sequence.get(),
+            'name': number and number or checkbook.reserve_numbers(1)[0],
             'checkbook': checkbook.id,
             'bank_account': self.start.bank_account.id,
             'amount': self.start.amount,
@@ -1115,7 +2209,7 @@ class IssuedCheckCash(Wizard):
         lines = []
         lines.append({
             'account':
-                self.start.bank_account.credit_account.id,
+                lookup(self.start.bank_account, 'credit_account').id,
             'move': move.id,
             'debit': _ZERO,
             'credit': check.amount,
@@ -1129,6 +2223,7 @@ class IssuedCheckCash(Wizard):
 
         MoveLine.create(lines)
         Move.post([move])
+        add_moves([move])
         IssuedCheck.write([check], {
             'state': 'debited',
             'cash_move': move
@@ -1148,6 +2243,8 @@ class IssuedCheckCancelStart(ModelView):
     from_number = fields.Integer('From Number', required=True)
     to_number = fields.Integer('To Number', required=True)
     date = fields.Date('Date', required=True)
+    background = fields.Boolean('Run in Background',
+        help="Create the canceled checks in background by chunks.")
 
     @staticmethod
     def default_date():
@@ -1171,32 +2268,241 @@ class IssuedCheckCancel(Wizard):
             ])
     cancel = StateTransition()
 
+    @instrumented
     def transition_cancel(self):
         pool = Pool()
-        IssuedCheck = pool.get('account.issued.check')
+        Checkbook = pool.get('account.checkbook')
 
         if self.start.from_number > self.start.to_number:
             raise UserError(
                 gettext('account_check_ar.msg_checkbook_to_number_lower'))
-        numbers = range(self.start.from_number, self.start.to_number + 1)
         checkbook = self.start.checkbook
         if self.start.from_number != checkbook.sequence.number_next:
             raise UserError(
                 gettext('account_check_ar.msg_checkbook_must_be_next_number'))
-        for number in numbers:
-            name = '%%0%sd' % checkbook.sequence.padding % number
-            check_exists = IssuedCheck.search([
-                    ('name', '=', name),
-                    ('bank_account', '=', checkbook.bank_account.id),
-                    ])
-            if check_exists:
-                continue
-            check, = IssuedCheck.create([{
-                'name': checkbook.sequence.get(),
-                'checkbook': checkbook.id,
-                'bank_account': self.start.bank_account.id,
-                'date': self.start.date,
-                'state': 'canceled',
-                }])
+        names = checkbook.reserve_numbers(
+            self.start.to_number - self.start.from_number + 1)
+        if self.start.background:
+            for sub_names in grouped_slice(names):
+                Checkbook.__queue__.create_canceled_checks(
+                    [checkbook], list(sub_names), self.start.date)
+        else:
+            Checkbook.create_canceled_checks(
+                [checkbook], names, self.start.date)
+
+        return 'end'
+
+
+class ThirdCheckImportStart(ModelView):
+    'Import Third Checks'
+    __name__ = 'account.third.check.import.start'
+
+    file_ = fields.Binary('File', required=True)
+    format = fields.Selection([
+        ('csv', 'CSV'),
+        ('echeq', 'e-Check Listing'),
+        ], 'Format', required=True,
+        help="CSV files are separated by comma.\n"
+        "e-Check listings are separated by semicolon "
+        "and their checks are electronic.")
+    encoding = fields.Char('Encoding', required=True)
+    currency = fields.Many2One('currency.currency', 'Currency', required=True)
+    date_in = fields.Date('Date In', required=True)
+
+    @staticmethod
+    def default_format():
+        return 'csv'
+
+    @staticmethod
+    def default_encoding():
+        return 'utf-8'
+
+    @staticmethod
+    def default_currency():
+        Company = Pool().get('company.company')
+        company_id = Transaction().context.get('company')
+        if company_id is not None and company_id >= 0:
+            return Company(company_id).currency.id
 
+    @staticmethod
+    def default_date_in():
+        Date = Pool().get('ir.date')
+        return Date.today()
+
+
+class ThirdCheckImport(Wizard):
+    'Import Third Checks'
+    __name__ = 'account.third.check.import'
+
+    start = StateView('account.third.check.import.start',
+        'account_check_ar.view_third_check_import_start', [
+            Button('Cancel', 'end', 'tryton-cancel'),
+            Button('Import', 'import_', 'tryton-ok', default=True),
+            ])
+    import_ = StateTransition()
+
+    _required_columns = {'number', 'bank', 'amount', 'date'}
+
+    def read_rows(self):
+        "Yield the line number and the row of the file one by one"
+        delimiter = ';' if self.start.format == 'echeq' else ','
+        stream = io.TextIOWrapper(io.BytesIO(self.start.file_),
+            encoding=self.start.encoding, newline='')
+        reader = csv.DictReader(stream, delimiter=delimiter)
+        missing = self._required_columns - set(reader.fieldnames or [])
+        if missing:
+            raise UserError(gettext(
+                    'account_check_ar.msg_check_import_missing_columns',
+                    columns=', '.join(sorted(missing))))
+        for row in reader:
+            yield reader.line_num, {
+                k.strip(): (v or '').strip() for k, v in row.items() if k}
+
+    @staticmethod
+    def _parse_amount(value, line):
+        """Return the amount of the value
+
+        The decimal separator is the last of the comma and the period, the
+        other one separates the thousands. A single separator followed by
+        three digits could be both so it is refused."""
+        separators = [c for c in value if c in ',.']
+        if not separators:
+            return Decimal(value)
+        decimal = separators[-1]
+        if len(set(separators)) == 1 and len(separators) > 1:
+            # Repeated, it separates the thousands
+            return Decimal(value.replace(decimal, ''))
+        integer, _, fraction = value.rpartition(decimal)
+        if (len(separators) == 1 and len(fraction) == 3
+                and integer.lstrip('+-') not in {'', '0'}):
+            raise UserError(gettext(
+                    'account_check_ar.msg_check_import_ambiguous_amount',
+                    line=line, amount=value))
+        thousands = ',' if decimal == '.' else '.'
+        return Decimal(integer.replace(thousands, '') + '.' + fraction)
+
+    @staticmethod
+    def _parse_date(value):
+        if '/' in value:
+            return datetime.datetime.strptime(value, '%d/%m/%Y').date()
+        return datetime.date.fromisoformat(value)
+
+    @staticmethod
+    def _parse_boolean(value):
+        return value.lower() in {'1', 'true', 'yes', 'si', 'sí', 'x'}
+
+    @staticmethod
+    def _compact(code):
+        return ''.join(c for c in code if c.isalnum())
+
+    def get_banks(self, codes):
+        "Return a dictionary of code and bank id"
+        Bank = Pool().get('bank')
+        banks = {}
+        for bank in Bank.search(['OR',
+                    ('bic', 'in', list(codes)),
+                    ('party.name', 'in', list(codes)),
+                    ]):
+            banks[bank.party.name] = bank.id
+            if bank.bic:
+                banks[bank.bic] = bank.id
+        return banks
+
+    def get_parties(self, codes):
+        "Return a dictionary of compacted identifier and party id"
+        Identifier = Pool().get('party.identifier')
+        return {i.code: i.party.id for i in Identifier.search([
+                    ('code', 'in', list(codes)),
+                    ])}
+
+    def get_checks_values(self, rows, seen):
+        """Return the values of the checks of the rows
+
+        seen is a dictionary of the keys of the checks already read with
+        their line number."""
+        pool = Pool()
+        ThirdCheck = pool.get('account.third.check')
+
+        banks = self.get_banks({r['bank'] for _, r in rows})
+        parties = self.get_parties({self._compact(r['party'])
+                for _, r in rows if r.get('party')})
+
+        vlist, keys = [], {}
+        for line, row in rows:
+            if not row['number']:
+                raise UserError(gettext(
+                        'account_check_ar.msg_check_import_missing_number',
+                        line=line))
+            bank = banks.get(row['bank'])
+            if not bank:
+                raise UserError(gettext(
+                        'account_check_ar.msg_check_import_unknown_bank',
+                        line=line, bank=row['bank']))
+            party = None
+            if row.get('party'):
+                party = parties.get(self._compact(row['party']))
+                if not party:
+                    raise UserError(gettext(
+                            'account_check_ar.msg_check_import_unknown_party',
+                            line=line, party=row['party']))
+            try:
+                amount = self._parse_amount(row['amount'], line)
+                date = self._parse_date(row['date'])
+            except (InvalidOperation, ValueError) as exception:
+                raise UserError(gettext(
+                        'account_check_ar.msg_check_import_invalid_line',
+                        line=line, error=exception)) from exception
+            key = (bank, row['number'], party)
+            if key in seen:
+                raise UserError(gettext(
+                        'account_check_ar.msg_check_import_duplicate',
+                        line=line, check=row['number'], previous=seen[key]))
+            seen[key] = keys[key] = line
+            values = {
+                'name': row['number'],
+                'bank': bank,
+                'source_party': party,
+                'amount': amount,
+                'date': date,
+                'date_in': self.start.date_in,
+                'currency': self.start.currency.id,
+                'electronic': self.start.format == 'echeq',
+                }
+            if row.get('electronic'):
+                values['electronic'] = self._parse_boolean(row['electronic'])
+            if row.get('not_to_order'):
+                values['not_to_order'] = self._parse_boolean(
+                    row['not_to_order'])
+            if row.get('clearing') in {'24', '48', '72'}:
+                values['clearing'] = row['clearing']
+            for name in ['signatory', 'vat', 'on_order', 'endorsed']:
+                if row.get(name):
+                    values[name] = row[name]
+            vlist.append(values)
+
+        # Check the existing duplicates with a single search
+        for check in ThirdCheck.search([
+                    ('bank', 'in', list({k[0] for k in keys})),
+                    ('name', 'in', list({k[1] for k in keys})),
+                    ]):
+            key = (check.bank.id, check.name,
+                check.source_party.id if check.source_party else None)
+            if key in keys:
+                raise UserError(gettext(
+                        'account_check_ar.msg_check_import_exists',
+                        line=keys[key], check=check.name))
+        return vlist
+
+    @instrumented
+    def transition_import_(self):
+        ThirdCheck = Pool().get('account.third.check')
+
+        size = Transaction().database.IN_MAX
+        rows = self.read_rows()
+        seen = {}
+        while True:
+            chunk = list(islice(rows, size))
+            if not chunk:
+                break
+            ThirdCheck.create(self.get_checks_values(chunk, seen))
         return 'end'
@@ -1,15 +1,95 @@
 # This file is part of the account_check_ar module for Tryton.
 # The COPYRIGHT file at the top level of this repository contains
 # the full copyright notices and license terms.
+import time
+from collections import Counter, defaultdict
 from decimal import Decimal
 
+from sql import Literal
+from sql.conditionals import Case, Coalesce
+
 from trytond.model import ModelView, fields
 from trytond.pool import Pool, PoolMeta
 from trytond.pyson import Eval, Not, In, Or
+from trytond.transaction import Transaction
 from trytond.exceptions import UserError
 from trytond.i18n import gettext
+from trytond.tools import grouped_slice, reduce_ids
+
+from .account_check_ar import find_period, lookup
+from .stats import add_moves, instrumented
 
 _ZERO = Decimal('0.0')
+# The time budget in seconds to select the checks of a payment
+_SELECT_CHECKS_BUDGET = 0.2
+# The maximum number of partial sums explored to select the checks
+_SELECT_CHECKS_STATES = 100000
+
+
+def _subset_sum(candidates, indexes, target, deadline):
+    """Return the greatest sum not greater than target of the candidates at
+    indexes and the indexes used"""
+    # Map each reachable sum to its previous sum and the last candidate
+    sums = {0: None}
+    best = count = 0
+    for i in indexes:
+        amount = candidates[i]
+        if amount <= 0 or amount > target:
+            continue
+        for sum_ in list(sums):
+            count += 1
+            if not count % 4096 and time.monotonic() > deadline:
+                break
+            new = sum_ + amount
+            if new > target or new in sums:
+                continue
+            if len(sums) >= _SELECT_CHECKS_STATES:
+                break
+            sums[new] = (sum_, i)
+            best = max(best, new)
+            if new == target:
+                break
+        else:
+            continue
+        break
+    used = []
+    sum_ = best
+    while sums[sum_]:
+        sum_, i = sums[sum_]
+        used.append(i)
+    return best, used
+
+
+def select_checks(candidates, target, budget=_SELECT_CHECKS_BUDGET):
+    '''
+    Return the indexes of the candidate amounts with the greatest sum not
+    greater than target. The candidates must be ordered by preference,
+    earlier candidates are used first.
+
+    A greedy selection is improved by keeping its earliest candidates and
+    searching the best subset-sum for the remaining amount among the later
+    candidates, until the target is reached or the time budget is spent.
+    '''
+    deadline = time.monotonic() + budget
+
+    greedy, total = [], 0
+    for i, amount in enumerate(candidates):
+        if 0 < amount <= target - total:
+            greedy.append(i)
+            total += amount
+
+    best, best_total = greedy, total
+    prefix_total = total
+    for k in range(len(greedy) - 1, -1, -1):
+        if best_total == target or time.monotonic() > deadline:
+            break
+        prefix_total -= candidates[greedy[k]]
+        start = greedy[k - 1] + 1 if k else 0
+        sum_, used = _subset_sum(candidates, range(start, len(candidates)),
+            target - prefix_total, deadline)
+        if prefix_total + sum_ > best_total:
+            best, best_total = greedy[:k] + used, prefix_total + sum_
+    return sorted(best)
 
 
 class AccountVoucher(metaclass=PoolMeta):
@@ -52,6 +132,51 @@ class AccountVoucher(metaclass=PoolMeta):
         cls.third_pay_checks.search_order = [
             ('date', 'ASC'),
             ]
+        cls._buttons.update({
+                'select_third_pay_checks': {
+                    'invisible': Eval('voucher_type') != 'payment',
+                    'readonly': Or(
+                        In(Eval('state'), ['posted', 'cancelled']),
+                        Not(In(Eval('currency_code'), ['ARS']))),
+                    'depends': ['voucher_type', 'state', 'currency_code'],
+                    },
+                })
+
+    @ModelView.button_change('third_pay_checks', 'amount_invoices',
+        'amount', 'currency', methods=['on_change_with_amount'])
+    def select_third_pay_checks(self):
+        "Add the held checks which fit best the remaining amount to pay"
+        pool = Pool()
+        ThirdCheck = pool.get('account.third.check')
+        check = ThirdCheck.__table__()
+        cursor = Transaction().connection.cursor()
+
+        if not self.currency:
+            return
+        remaining = (self.amount_invoices or _ZERO) - (self.amount or _ZERO)
+        if remaining <= 0:
+            return
+        factor = 10 ** self.currency.digits
+        selected = [c.id for c in self.third_pay_checks if c.id >= 0]
+
+        # The earliest maturities first using the date index of held checks
+        where = (check.state.in_(['held', 'reverted'])
+            & (Coalesce(check.not_to_order, Literal(False)) == Literal(False))
+            & (check.currency == self.currency.id)
+            & (check.amount <= remaining))
+        if selected:
+            where &= ~check.id.in_(selected)
+        cursor.execute(*check.select(check.id, check.amount,
+                where=where,
+                order_by=[check.date.asc, check.id.asc]))
+        ids, amounts = [], []
+        for id_, amount in cursor:
+            ids.append(id_)
+            amounts.append(int(Decimal(str(amount)) * factor))
+        indexes = select_checks(amounts, int(remaining * factor))
+        self.third_pay_checks = list(self.third_pay_checks) + [
+            ThirdCheck(ids[i]) for i in indexes]
+        self.amount = self.on_change_with_amount()
 
     @fields.depends('third_check', 'issued_check', 'third_pay_checks')
     def on_change_with_amount(self, name=None):
@@ -68,17 +193,16 @@ class AccountVoucher(metaclass=PoolMeta):
         return amount
 
     def prepare_move_lines(self):
-        pool = Pool()
-        Period = pool.get('account.period')
-
         move_lines = super().prepare_move_lines()
 
         journal = self.journal
-        period = Period.find(self.company, date=self.date)
+        period = find_period(self.company, self.date)
+        third_check_account = lookup(journal, 'third_check_account')
+        issued_check_account = lookup(journal, 'issued_check_account')
 
         if self.voucher_type == 'receipt':
             if self.third_check:
-                if not journal.third_check_account:
+                if not third_check_account:
                     raise UserError(gettext(
                         'account_voucher_ar.msg_no_journal_check_account',
                         journal=journal.name))
@@ -90,19 +214,19 @@ class AccountVoucher(metaclass=PoolMeta):
                     move_lines.append({
                         'debit': check.amount,
                         'credit': _ZERO,
-                        'account': journal.third_check_account.id,
+                        'account': third_check_account.id,
                         'move': self.move.id,
                         'journal': journal.id,
                         'period': period.id,
                         'party': (
-                            journal.third_check_account.party_required and
+                            third_check_account.party_required and
                             self.party.id or None),
                         'maturity_date': check.date,
                     })
 
         if self.voucher_type == 'payment':
             if self.issued_check:
-                if not journal.issued_check_account:
+                if not issued_check_account:
                     raise UserError(gettext(
                         'account_voucher_ar.msg_no_journal_check_account',
                         journal=journal.name))
@@ -110,12 +234,12 @@ class AccountVoucher(metaclass=PoolMeta):
                     move_lines.append({
                         'debit': _ZERO,
                         'credit': check.amount,
-                        'account': journal.issued_check_account.id,
+                        'account': issued_check_account.id,
                         'move': self.move.id,
                         'journal': journal.id,
                         'period': period.id,
                         'party': (
-                            journal.issued_check_account.party_required and
+                            issued_check_account.party_required and
                             self.party.id or None),
                         'maturity_date': check.date,
                         })
@@ -124,12 +248,12 @@ class AccountVoucher(metaclass=PoolMeta):
                     move_lines.append({
                         'debit': _ZERO,
                         'credit': check.amount,
-                        'account': journal.third_check_account.id,
+                        'account': third_check_account.id,
                         'move': self.move.id,
                         'journal': journal.id,
                         'period': period.id,
                         'party': (
-                            journal.third_check_account.party_required and
+                            third_check_account.party_required and
                             self.party.id or None),
                         'maturity_date': check.date,
                         })
@@ -137,86 +261,179 @@ class AccountVoucher(metaclass=PoolMeta):
         return move_lines
 
     @classmethod
+    @instrumented
     @ModelView.button
     def post(cls, vouchers):
+        super().post(vouchers)
+        add_moves([v.move for v in vouchers if v.move])
+
+        cls.post_issued_checks(vouchers)
+        cls.post_third_checks(vouchers)
+
+    @classmethod
+    def post_third_checks(cls, vouchers):
+        '''
+        Hold the received third checks and deliver the paid third checks of
+        the vouchers with a single grouped write per state and party.
+        '''
         pool = Pool()
         ThirdCheck = pool.get('account.third.check')
-        IssuedCheck = pool.get('account.issued.check')
         Date = pool.get('ir.date')
 
-        super().post(vouchers)
+        held, delivered = defaultdict(list), defaultdict(list)
+        for voucher in vouchers:
+            held[voucher.party].extend(voucher.third_check)
+            delivered[voucher.party].extend(voucher.third_pay_checks)
 
         today = Date.today()
+        to_write = []
+        for party, checks in held.items():
+            if checks:
+                to_write.extend((checks, {
+                            'source_party': party.id,
+                            'state': 'held',
+                            }))
+        for party, checks in delivered.items():
+            if checks:
+                to_write.extend((checks, {
+                            'destiny_party': party.id,
+                            'date_out': today,
+                            'state': 'delivered',
+                            }))
+        if to_write:
+            ThirdCheck.write(*to_write)
+
+    @classmethod
+    def post_issued_checks(cls, vouchers):
+        '''
+        Number and issue the checks of the vouchers in batch.
+        The numbers of each checkbook are reserved as a single block.
+        '''
+        pool = Pool()
+        IssuedCheck = pool.get('account.issued.check')
+
+        checks = [c for v in vouchers for c in v.issued_check]
+        if not checks:
+            return
+
+        numbers = {}
+        checkbook2checks = defaultdict(list)
+        for check in checks:
+            if check.checkbook:
+                checkbook2checks[check.checkbook].append(check)
+            else:
+                numbers[check] = check.name
+        for checkbook, checkbook_checks in checkbook2checks.items():
+            numbers.update(zip(checkbook_checks,
+                    checkbook.reserve_numbers(len(checkbook_checks))))
+
+        keys = [(numbers[c], c.bank_account.id) for c in checks]
+        for key, count in Counter(keys).items():
+            if count > 1:
+                raise UserError(gettext(
+                    'account_check_ar.msg_check_already_exists',
+                    number=key[0]))
+        check_ids = {c.id for c in checks}
+        keys = set(keys)
+        for sub_numbers in grouped_slice(list({k[0] for k in keys})):
+            for check in IssuedCheck.search([
+                        ('name', 'in', list(sub_numbers)),
+                        ('bank_account', 'in',
+                            list({k[1] for k in keys})),
+                        ]):
+                if (check.id not in check_ids
+                        and (check.name, check.bank_account.id) in keys):
+                    raise UserError(gettext(
+                        'account_check_ar.msg_check_already_exists',
+                        number=check.name))
+
+        # The numbers are specific to each check so they are updated with a
+        # single query per slice, the write of the party and state following
+        # it sets the write date and user
+        table = IssuedCheck.__table__()
+        cursor = Transaction().connection.cursor()
+        for sub_checks in grouped_slice(checks):
+            sub_checks = list(sub_checks)
+            cursor.execute(*table.update([table.name], [
+                        Case(*((table.id == c.id, numbers[c])
+                                for c in sub_checks))],
+                    where=reduce_ids(table.id, [c.id for c in sub_checks])))
+
+        party2checks = defaultdict(list)
         for voucher in vouchers:
-            if voucher.issued_check:
-                for check in voucher.issued_check:
-                    number = (check.checkbook and
-                        check.checkbook.sequence.get() or check.name)
-                    check_exists = IssuedCheck.search([
-                        ('name', '=', number),
-                        ('bank_account', '=', check.bank_account.id),
-                        ('id', '!=', check.id),
-                        ])
-                    if check_exists:
-                        raise UserError(gettext(
-                            'account_check_ar.msg_check_already_exists',
-                            number=number))
-                    IssuedCheck.write([check], {
-                        'receiving_party': voucher.party.id,
-                        'state': 'issued',
-                        'name': number,
-                        })
-                IssuedCheck.issued(voucher.issued_check)
-            if voucher.third_check:
-                ThirdCheck.write(list(voucher.third_check), {
-                    'source_party': voucher.party.id,
-                    'state': 'held',
-                    })
-            if voucher.third_pay_checks:
-                ThirdCheck.write(list(voucher.third_pay_checks), {
-                    'destiny_party': voucher.party.id,
-                    'date_out': today,
-                    'state': 'delivered',
-                    })
+            party2checks[voucher.party].extend(
+                c.id for c in voucher.issued_check)
+        to_write = []
+        for party, check_ids in party2checks.items():
+            to_write.extend((IssuedCheck.browse(check_ids), {
+                    'receiving_party': party.id,
+                    'state': 'issued',
+                    }))
+        IssuedCheck.write(*to_write)
+        IssuedCheck.issued(IssuedCheck.browse([c.id for c in checks]))
 
     @classmethod
+    @instrumented
     @ModelView.button
     def cancel(cls, vouchers):
         pool = Pool()
         ThirdCheck = pool.get('account.third.check')
         IssuedCheck = pool.get('account.issued.check')
 
-        for voucher in vouchers:
-            if voucher.issued_check:
-                for check in voucher.issued_check:
-                    if check.state != 'issued':
-                        raise UserError(gettext(
-                            'account_voucher_ar.msg_issued_check_not_issued',
-                            check=check.name))
-                IssuedCheck.write(list(voucher.issued_check), {
+        issued_checks = [c for v in vouchers for c in v.issued_check]
+        third_checks = [c for v in vouchers for c in v.third_check]
+        third_pay_checks = [c for v in vouchers for c in v.third_pay_checks]
+
+        cls.check_checks_state(IssuedCheck, [
+                (issued_checks, {'issued'},
+                    'account_voucher_ar.msg_issued_check_not_issued'),
+                ])
+        cls.check_checks_state(ThirdCheck, [
+                (third_checks, {'held', 'reverted'},
+                    'account_voucher_ar.msg_third_check_not_held'),
+                (third_pay_checks, {'delivered'},
+                    'account_voucher_ar.msg_third_pay_check_not_delivered'),
+                ])
+
+        if issued_checks:
+            IssuedCheck.write(issued_checks, {
                     'receiving_party': None,
                     'state': 'draft',
                     })
-            if voucher.third_check:
-                for check in voucher.third_check:
-                    if check.state not in ['held', 'reverted']:
-                        raise UserError(gettext(
-                            'account_voucher_ar.msg_third_check_not_held',
-                            check=check.name))
-                ThirdCheck.write(list(voucher.third_check), {
-                    'source_party': None,
-                    'state': 'draft',
-                    })
-            if voucher.third_pay_checks:
-                for check in voucher.third_pay_checks:
-                    if check.state != 'delivered':
-                        raise UserError(gettext('account_voucher_ar.'
-                            'msg_third_pay_check_not_delivered',
-                            check=check.name))
-                ThirdCheck.write(list(voucher.third_pay_checks), {
-                    'destiny_party': None,
-                    'date_out': None,
-                    'state': 'held',
-                    })
+        to_write = []
+        if third_checks:
+            to_write.extend((third_checks, {
+                        'source_party': None,
+                        'state': 'draft',
+                        }))
+        if third_pay_checks:
+            to_write.extend((third_pay_checks, {
+                        'destiny_party': None,
+                        'date_out': None,
+                        'state': 'held',
+                        }))
+        if to_write:
+            ThirdCheck.write(*to_write)
 
         super().cancel(vouchers)
+
+    @classmethod
+    def check_checks_state(cls, Check, groups):
+        '''
+        Check the states of the checks of a model with a single query.
+        groups is a list of (checks, states, message) and the message is
+        raised for the first check which is not in one of the states.
+        '''
+        table = Check.__table__()
+        cursor = Transaction().connection.cursor()
+
+        ids = {c.id for checks, _, _ in groups for c in checks}
+        states = {}
+        for sub_ids in grouped_slice(list(ids)):
+            cursor.execute(*table.select(table.id, table.state,
+                    where=reduce_ids(table.id, sub_ids)))
+            states.update(cursor)
+        for checks, allowed, message in groups:
+            for check in checks:
+                if states.get(check.id) not in allowed:
+                    raise UserError(gettext(message, check=check.name))
@@ -0,0 +1,346 @@
+# This file is part of the account_check_ar module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from sql import Column, Literal, Null, Union, Values, Window
+from sql.aggregate import Count, Max, Min, Sum
+from sql.conditionals import Case, Coalesce
+from sql.functions import CurrentTimestamp, RowNumber
+
+from trytond.cache import Cache
+from trytond.model import ModelSQL, ModelView, fields
+from trytond.modules.currency.fields import Monetary
+from trytond.pool import Pool
+from trytond.pyson import Eval
+from trytond.transaction import Transaction
+
+_STATES = {
+    'account.issued.check': ['issued'],
+    'account.third.check': ['held', 'deposited', 'delivered'],
+    }
+
+
+class CheckPortfolio(ModelSQL, ModelView):
+    'Check Portfolio'
+    __name__ = 'account.check.portfolio'
+
+    kind = fields.Selection([
+        ('third', 'Third Check'),
+        ('issued', 'Issued Check'),
+        ], 'Kind')
+    bank = fields.Many2One('bank', 'Bank')
+    state = fields.Selection([
+        ('issued', 'Issued'),
+        ('held', 'Held'),
+        ('deposited', 'Deposited'),
+        ('delivered', 'Delivered'),
+        ], 'State')
+    currency = fields.Many2One('currency.currency', 'Currency')
+    count = fields.Integer('Count')
+    term0 = Monetary("Matured", currency='currency', digits='currency')
+    term1 = Monetary("First Term", currency='currency', digits='currency')
+    term2 = Monetary("Second Term", currency='currency', digits='currency')
+    term3 = Monetary("Third Term", currency='currency', digits='currency')
+    later = Monetary("Later", currency='currency', digits='currency')
+    amount = Monetary("Amount", currency='currency', digits='currency')
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls._order = [
+            ('kind', 'DESC'),
+            ('bank', 'ASC'),
+            ('state', 'ASC'),
+            ]
+
+    @classmethod
+    def get_terms(cls):
+        "Return the number of days of each term"
+        context = Transaction().context
+        return [context.get('term1', 30), context.get('term2', 60),
+            context.get('term3', 90)]
+
+    @classmethod
+    def table_query(cls):
+        pool = Pool()
+        Date = pool.get('ir.date')
+        IssuedCheck = pool.get('account.issued.check')
+        ThirdCheck = pool.get('account.third.check')
+        BankAccount = pool.get('bank.account')
+
+        date = Transaction().context.get('date') or Date.today()
+
+        third = ThirdCheck.__table__()
+        log = cls._last_logs(ThirdCheck, date)
+        third_query = third.join(log,
+            condition=third.id == log.check_id
+            ).select(*cls._columns(third, log, date,
+                    kind='third', offset=0, bank=third.bank,
+                    currency=third.currency),
+                where=(log.rank == 1)
+                & log.state.in_(_STATES[ThirdCheck.__name__]),
+                group_by=[third.bank, third.currency, log.state])
+
+        issued = IssuedCheck.__table__()
+        bank_account = BankAccount.__table__()
+        log = cls._last_logs(IssuedCheck, date)
+        issued_query = issued.join(log,
+            condition=issued.id == log.check_id
+            ).join(bank_account,
+                condition=issued.bank_account == bank_account.id
+            ).select(*cls._columns(issued, log, date,
+                    kind='issued', offset=1, bank=bank_account.bank,
+                    currency=bank_account.currency),
+                where=(log.rank == 1)
+                & log.state.in_(_STATES[IssuedCheck.__name__]),
+                group_by=[bank_account.bank, bank_account.currency,
+                    log.state])
+        return Union(third_query, issued_query, all_=True)
+
+    @classmethod
+    def _last_logs(cls, Check, date):
+        """Return the query of the logs of the checks ranked from the last
+        one at the date"""
+        Log = Pool().get('account.check.state.log')
+        log = Log.__table__()
+        return log.select(log.check_id, log.state,
+            RowNumber(window=Window([log.check_id],
+                    order_by=[log.date.desc, log.id.desc])).as_('rank'),
+            where=(log.check_model == Check.__name__) & (log.date <= date))
+
+    @classmethod
+    def _columns(cls, check, log, date, kind, offset, bank, currency):
+        columns = [
+            (Min(check.id) * 2 + offset).as_('id'),
+            Literal(0).as_('create_uid'),
+            Max(check.create_date).as_('create_date'),
+            Literal(0).as_('write_uid'),
+            Max(check.write_date).as_('write_date'),
+            Literal(kind).as_('kind'),
+            bank.as_('bank'),
+            log.state.as_('state'),
+            currency.as_('currency'),
+            Count(check.id).as_('count'),
+            ]
+        bounds = [date] + [date + datetime.timedelta(days=d)
+            for d in cls.get_terms()]
+        lower = None
+        for name, upper in zip(['term0', 'term1', 'term2', 'term3'], bounds):
+            cond = check.date <= upper
+            if lower is not None:
+                cond &= check.date > lower
+            columns.append(
+                Sum(Case((cond, check.amount), else_=0)).as_(name))
+            lower = upper
+        columns.append(
+            Sum(Case((check.date > lower, check.amount), else_=0)
+                ).as_('later'))
+        columns.append(Sum(check.amount).as_('amount'))
+        return columns
+
+
+class CheckPortfolioContext(ModelView):
+    'Check Portfolio Context'
+    __name__ = 'account.check.portfolio.context'
+
+    date = fields.Date('Date', required=True)
+    term1 = fields.Integer("First Term", required=True,
+        help="In days.")
+    term2 = fields.Integer("Second Term", required=True,
+        domain=[
+            ('term2', '>', Eval('term1', 0)),
+            ],
+        help="In days.")
+    term3 = fields.Integer("Third Term", required=True,
+        domain=[
+            ('term3', '>', Eval('term2', 0)),
+            ],
+        help="In days.")
+
+    @classmethod
+    def default_date(cls):
+        Date = Pool().get('ir.date')
+        return Date.today()
+
+    @classmethod
+    def default_term1(cls):
+        return 30
+
+    @classmethod
+    def default_term2(cls):
+        return 60
+
+    @classmethod
+    def default_term3(cls):
+        return 90
+
+
+class CheckProjection(ModelSQL, ModelView):
+    'Check Projection'
+    __name__ = 'account.check.projection'
+
+    date = fields.Date('Date')
+    currency = fields.Many2One('currency.currency', 'Currency')
+    incoming = Monetary("Incoming", currency='currency', digits='currency',
+        help="The amount of the held and deposited third checks.")
+    outgoing = Monetary("Outgoing", currency='currency', digits='currency',
+        help="The amount of the issued checks to debit.")
+    net = Monetary("Net", currency='currency', digits='currency')
+    balance = Monetary("Balance", currency='currency', digits='currency',
+        help="The accumulated net amount.")
+    _cache = Cache(__name__, context=False)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls._order = [
+            ('date', 'ASC'),
+            ('currency', 'ASC'),
+            ]
+
+    @classmethod
+    def table_query(cls):
+        pool = Pool()
+        Date = pool.get('ir.date')
+
+        rows = cls.get_rows()
+        where = Literal(True)
+        if not rows:
+            # VALUES requires at least one row
+            rows = [(0, Date.today(), 0) + (Decimal(0),) * 4]
+            where = Literal(False)
+        values = Values(rows)
+        # The VALUES columns have no type so they are cast like the fields
+        names = ['id', 'date', 'currency', 'incoming', 'outgoing', 'net',
+            'balance']
+        columns = [getattr(cls, n).sql_cast(Column(values, 'column%s' % i))
+            for i, n in enumerate(names, 1)]
+        return values.select(
+            columns[0].as_('id'),
+            Literal(0).as_('create_uid'),
+            CurrentTimestamp().as_('create_date'),
+            Literal(0).as_('write_uid'),
+            Null.as_('write_date'),
+            *(c.as_(n) for c, n in zip(columns[1:], names[1:])),
+            where=where)
+
+    @classmethod
+    def get_rows(cls):
+        "Return the cached rows of the projection"
+        pool = Pool()
+        Date = pool.get('ir.date')
+        context = Transaction().context
+
+        key = (context.get('bucket') or 'day', Date.today(),
+            context.get('days') or 180, context.get('company'))
+        rows = cls._cache.get(key)
+        if rows is None:
+            rows = cls._compute_rows(*key)
+            cls._cache.set(key, rows)
+        return [tuple(r) for r in rows]
+
+    @classmethod
+    def _compute_rows(cls, bucket, start, days, company):
+        pool = Pool()
+        IssuedCheck = pool.get('account.issued.check')
+        ThirdCheck = pool.get('account.third.check')
+        BankAccount = pool.get('bank.account')
+        BankAccountOwner = pool.get('bank.account-party.party')
+        Company = pool.get('company.company')
+        Move = pool.get('account.move')
+        Voucher = pool.get('account.voucher')
+        cursor = Transaction().connection.cursor()
+
+        end = start + datetime.timedelta(days=days)
+        amounts = defaultdict(lambda: [Decimal(0), Decimal(0)])
+
+        def add(query, index):
+            cursor.execute(*query)
+            for date, clearing, currency, amount in cursor:
+                if isinstance(date, str):
+                    date = datetime.date.fromisoformat(date)
+                if not isinstance(amount, Decimal):
+                    amount = Decimal(str(amount))
+                date += datetime.timedelta(hours=int(clearing or 0))
+                if date > end:
+                    continue
+                date = cls._bucket_date(max(date, start), bucket)
+                amounts[(date, currency)][index] += amount
+
+        third = ThirdCheck.__table__()
+        voucher = Voucher.__table__()
+        move = Move.__table__()
+        where = (third.state.in_(['held', 'reverted', 'deposited'])
+            & (third.date <= end))
+        if company is not None:
+            # The third checks belong to the company which received them
+            where &= Coalesce(voucher.company, move.company) == company
+        add(third.join(voucher, 'LEFT',
+                condition=third.voucher_in == voucher.id
+                ).join(move, 'LEFT',
+                condition=third.held_move == move.id
+                ).select(
+                third.date, third.clearing, third.currency,
+                Sum(third.amount),
+                where=where,
+                group_by=[third.date, third.clearing, third.currency]), 0)
+        issued = IssuedCheck.__table__()
+        bank_account = BankAccount.__table__()
+        owner = BankAccountOwner.__table__()
+        where = (issued.state == 'issued') & (issued.date <= end)
+        if company is not None:
+            # The issued checks belong to the owner of their bank account
+            where &= issued.bank_account.in_(owner.select(owner.account,
+                    where=owner.owner == Company(company).party.id))
+        add(issued.join(bank_account,
+                condition=issued.bank_account == bank_account.id
+                ).select(
+                issued.date, issued.clearing, bank_account.currency,
+                Sum(issued.amount),
+                where=where,
+                group_by=[issued.date, issued.clearing,
+                    bank_account.currency]), 1)
+
+        rows = []
+        balances = defaultdict(Decimal)
+        for id_, ((date, currency), (incoming, outgoing)) in enumerate(
+                sorted(amounts.items()), 1):
+            net = incoming - outgoing
+            balances[currency] += net
+            rows.append((id_, date, currency, incoming, outgoing, net,
+                    balances[currency]))
+        return rows
+
+    @classmethod
+    def _bucket_date(cls, date, bucket):
+        if bucket == 'week':
+            return date - datetime.timedelta(days=date.weekday())
+        elif bucket == 'month':
+            return date.replace(day=1)
+        return date
+
+
+class CheckProjectionContext(ModelView):
+    'Check Projection Context'
+    __name__ = 'account.check.projection.context'
+
+    bucket = fields.Selection([
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+        ], 'Bucket', required=True)
+    days = fields.Integer('Days', required=True,
+        domain=[
+            ('days', '>', 0),
+            ])
+
+    @classmethod
+    def default_bucket(cls):
+        return 'day'
+
+    @classmethod
+    def default_days(cls):
+        return 180
@@ -1,13 +1,24 @@
 # This file is part of the account_check_ar module for Tryton.
 # The COPYRIGHT file at the top level of this repository contains
 # the full copyright notices and license terms.
-from itertools import groupby
+import datetime
+from collections import Counter, defaultdict
 
-from trytond.model import fields, Workflow
+from sql import Null
+from sql.aggregate import Count
+
+from trytond.model import ModelSQL, ModelView, fields, Workflow, Index
 from trytond.pool import Pool, PoolMeta
 from trytond.pyson import Eval, If, Bool
+from trytond.transaction import Transaction
 from trytond.exceptions import UserError
 from trytond.i18n import gettext
+from trytond.tools import grouped_slice
+
+from .account_check_ar import lookup
+from .stats import instrumented
+
+_CHECK_MATCH_DAYS = 30
 
 
 class AccountIssuedCheck(metaclass=PoolMeta):
@@ -16,6 +27,27 @@ class AccountIssuedCheck(metaclass=PoolMeta):
     related_statement_line = fields.Many2One('account.statement.line',
         'Statement Line', readonly=True)
 
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.update({
+            Index(t,
+                (t.related_statement_line, Index.Equality()),
+                where=t.related_statement_line != Null),
+            Index(t,
+                (t.amount, Index.Equality()),
+                where=(t.related_statement_line == Null)
+                & (t.state == 'issued')),
+            })
+
+    @classmethod
+    def _get_matured_domain(cls, date):
+        # The checks related to a statement line are debited by the statement
+        return super()._get_matured_domain(date) + [
+            ('related_statement_line', '=', None),
+            ]
+
 
 class AccountThirdCheck(metaclass=PoolMeta):
     __name__ = 'account.third.check'
@@ -23,24 +55,183 @@ class AccountThirdCheck(metaclass=PoolMeta):
     related_statement_line = fields.Many2One('account.statement.line',
         'Statement Line', readonly=True)
 
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.update({
+            Index(t,
+                (t.related_statement_line, Index.Equality()),
+                where=t.related_statement_line != Null),
+            Index(t,
+                (t.amount, Index.Equality()),
+                where=(t.related_statement_line == Null)
+                & (t.state == 'deposited')),
+            })
+
+
+class ThirdCheckDepositSlip(metaclass=PoolMeta):
+    __name__ = 'account.third.check.deposit.slip'
+
+    related_statement_line = fields.Many2One('account.statement.line',
+        'Statement Line', readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.update({
+            Index(t,
+                (t.related_statement_line, Index.Equality()),
+                where=t.related_statement_line != Null),
+            Index(t,
+                (t.amount, Index.Equality()),
+                where=t.related_statement_line == Null),
+            })
+
 
 class Statement(metaclass=PoolMeta):
     __name__ = 'account.statement'
 
+    check_reviews = fields.One2Many('account.statement.line.check_review',
+        'statement', 'Checks to Review', readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls._buttons.update({
+                'match_checks': {
+                    'invisible': Eval('state') != 'draft',
+                    'depends': ['state'],
+                    },
+                })
+
+    @classmethod
+    @instrumented
+    @ModelView.button
+    def match_checks(cls, statements):
+        '''
+        Relate the unmatched lines to the issued and third checks of the
+        statement bank account with the same amount and a date in the
+        matching window. Lines with many candidates are queued for review.
+        '''
+        pool = Pool()
+        IssuedCheck = pool.get('account.issued.check')
+        ThirdCheck = pool.get('account.third.check')
+        Slip = pool.get('account.third.check.deposit.slip')
+        StatementLine = pool.get('account.statement.line')
+        Review = pool.get('account.statement.line.check_review')
+
+        Review.delete(Review.search([
+                    ('statement', 'in', [s.id for s in statements]),
+                    ]))
+
+        issued_lines, third_lines = [], []
+        for statement in statements:
+            bank_account = statement.journal.bank_account
+            if not bank_account:
+                continue
+            for line in statement.lines:
+                if line.related_to or not line.amount:
+                    continue
+                if line.amount < 0:
+                    issued_lines.append((bank_account, line))
+                else:
+                    third_lines.append((bank_account, line))
+
+        line2candidates = {}
+        line2candidates.update(cls._get_check_candidates(
+                IssuedCheck, issued_lines, [
+                    ('state', '=', 'issued'),
+                    ], 'bank_account', 'receiving_party'))
+        # The checks of a deposit slip are matched by the slip total
+        line2candidates.update(cls._get_check_candidates(
+                Slip, third_lines, [
+                    ('checks', 'not where', [
+                            ('related_statement_line', '!=', None),
+                            ]),
+                    ], 'bank_account', None))
+        for line, candidates in cls._get_check_candidates(
+                ThirdCheck, third_lines, [
+                    ('state', '=', 'deposited'),
+                    ('deposit_slip', '=', None),
+                    ], 'account_bank_out', 'source_party').items():
+            line2candidates.setdefault(line, []).extend(candidates)
+
+        # A check can only be matched if it is the single candidate of a
+        # single line
+        sole_candidates = Counter(c[0] for c in line2candidates.values()
+            if len(c) == 1)
+        to_write, reviews = [], []
+        for line, candidates in line2candidates.items():
+            if len(candidates) == 1 and sole_candidates[candidates[0]] == 1:
+                to_write.extend(([line],
+                        line.get_check_match_values(candidates[0])))
+            else:
+                reviews.extend({
+                        'statement': line.statement.id,
+                        'line': line.id,
+                        'check': str(check),
+                        } for check in candidates)
+        if to_write:
+            StatementLine.write(*to_write)
+        if reviews:
+            Review.create(reviews)
+
     @classmethod
+    def _get_check_candidates(
+            cls, Check, lines, domain, bank_field, party_field):
+        "Return a dictionary of line and candidate checks"
+        if not lines:
+            return {}
+        window = datetime.timedelta(days=_CHECK_MATCH_DAYS)
+        bank_ids = list({b.id for b, _ in lines})
+        amounts = list({abs(l.amount) for _, l in lines})
+        min_date = min(l.date for _, l in lines) - window
+        max_date = max(l.date for _, l in lines)
+
+        key2checks = defaultdict(list)
+        for sub_amounts in grouped_slice(amounts):
+            for check in Check.search(domain + [
+                        ('related_statement_line', '=', None),
+                        (bank_field, 'in', bank_ids),
+                        ('amount', 'in', list(sub_amounts)),
+                        ('date', '>=', min_date),
+                        ('date', '<=', max_date),
+                        ], order=[('date', 'ASC')]):
+                key = (getattr(check, bank_field).id, check.amount)
+                key2checks[key].append(check)
+
+        line2candidates = {}
+        for bank_account, line in lines:
+            party = getattr(line, 'party', None)
+            candidates = [c for c in key2checks[
+                    (bank_account.id, abs(line.amount))]
+                if c.date <= line.date <= c.date + window
+                and (not party or not party_field
+                    or getattr(c, party_field) == party)]
+            if candidates:
+                line2candidates[line] = candidates
+        return line2candidates
+
+    @classmethod
+    @instrumented
     @Workflow.transition('validated')
     def validate_statement(cls, statements):
         pool = Pool()
         ThirdCheck = pool.get('account.third.check')
+        Slip = pool.get('account.third.check.deposit.slip')
         StatementLine = Pool().get('account.statement.line')
 
         super(Statement, cls).validate_statement(statements)
         # Remove created draft moves when line is related to third checks
+        # or deposit slips as their moves already exist
         lines = [l for s in statements for l in s.lines
-            if isinstance(l.related_to, ThirdCheck)]
+            if isinstance(l.related_to, (ThirdCheck, Slip))]
         StatementLine.delete_move(lines)
 
     @classmethod
+    @instrumented
     @Workflow.transition('posted')
     def post(cls, statements):
         pool = Pool()
@@ -48,35 +239,67 @@ class Statement(metaclass=PoolMeta):
 
         super(Statement, cls).post(statements)
         # Change issued checks state
-        lines = [l for s in statements for l in s.lines
-            if isinstance(l.related_to, IssuedCheck)]
-        checks = []
-        for l in lines:
-            check = IssuedCheck(l.related_to.id)
-            check.state = 'debited'
-            check.debit_date = l.date
-            checks.append(check)
-        IssuedCheck.save(checks)
+        date2checks = defaultdict(list)
+        for s in statements:
+            for l in s.lines:
+                if isinstance(l.related_to, IssuedCheck):
+                    date2checks[l.date].append(IssuedCheck(l.related_to.id))
+        for date, checks in date2checks.items():
+            with Transaction().set_context(check_state_date=date):
+                IssuedCheck.write(checks, {
+                        'state': 'debited',
+                        'debit_date': date,
+                        })
 
     @classmethod
     def validate(cls, statements):
         super(Statement, cls).validate(statements)
-        for statement in statements:
-            statement.repeated_check_related_to()
-
-    def repeated_check_related_to(self):
-        # Control if check is related twice
-        check_types = ['issued_check', 'third_check']
-        for type_ in check_types:
-            lines = [l for l in self.lines if getattr(l, type_, None)]
-            for key, group in groupby(lines, lambda x: getattr(x, type_)):
-                numbers = []
-                for line in group:
-                    numbers.append(line.number)
-                if len(numbers) > 1:
-                    raise UserError(gettext(
-                        'account_check_ar.msg_check_already_in_statement',
-                        check=key.name, lines=', '.join(numbers)))
+        cls.check_repeated_check_related_to(statements)
+
+    @classmethod
+    def check_repeated_check_related_to(cls, statements):
+        "Control if a check is related twice"
+        pool = Pool()
+        StatementLine = pool.get('account.statement.line')
+        line = StatementLine.__table__()
+        statement = cls.__table__()
+        cursor = Transaction().connection.cursor()
+
+        def lines_names(lines):
+            return ', '.join(
+                ' / '.join(filter(None, [l.statement.rec_name, l.number]))
+                for l in lines)
+
+        check2lines = defaultdict(list)
+        for s in statements:
+            for l in s.lines:
+                check = l.issued_check or l.third_check or l.deposit_slip
+                if check:
+                    check2lines[check].append(l)
+        for check, lines in check2lines.items():
+            if len(lines) > 1:
+                raise UserError(gettext(
+                    'account_check_ar.msg_check_already_in_statement',
+                    check=check.rec_name, lines=lines_names(lines)))
+
+        # Control lines of other statements with one query per slice
+        for sub_checks in grouped_slice(list(check2lines.keys())):
+            cursor.execute(*line.join(statement,
+                    condition=line.statement == statement.id
+                    ).select(line.related_to,
+                    where=line.related_to.in_([str(c) for c in sub_checks])
+                    & (statement.state != 'cancelled'),
+                    group_by=[line.related_to],
+                    having=Count(line.id) > 1))
+            for related_to, in cursor:
+                lines = StatementLine.search([
+                        ('related_to', '=', related_to),
+                        ('statement.state', '!=', 'cancelled'),
+                        ])
+                raise UserError(gettext(
+                    'account_check_ar.msg_check_already_in_statement',
+                    check=lines[0].related_to.rec_name,
+                    lines=lines_names(lines)))
 
 
 class StatementLine(metaclass=PoolMeta):
@@ -111,6 +334,20 @@ class StatementLine(metaclass=PoolMeta):
             [('related_statement_line', '=', Eval('id', -1))],
             [('related_statement_line', '=', None),
                 ('state', 'in', ['deposited']),
+                ['OR',
+                    ('deposit_slip', '=', None),
+                    ('deposit_slip.related_statement_line', '=', None),
+                    ],
+                ('amount', '=', Eval('abs_amount', 0)),
+            ]]
+        cls.related_to.domain['account.third.check.deposit.slip'] = ['OR',
+            [('related_statement_line', '=', Eval('id', -1))],
+            [('related_statement_line', '=', None),
+                ('checks', 'not where', [
+                        ('related_statement_line', '!=', None),
+                        ]),
+                ('bank_account', '=',
+                    Eval('statement_journal_bank_account', -1)),
                 ('amount', '=', Eval('abs_amount', 0)),
             ]]
         cls.related_to.search_order['account.issued.check'] = [
@@ -119,6 +356,9 @@ class StatementLine(metaclass=PoolMeta):
         cls.related_to.search_order['account.third.check'] = [
             ('amount', 'ASC'),
             ]
+        cls.related_to.search_order['account.third.check.deposit.slip'] = [
+            ('date', 'DESC'),
+            ]
 
     @fields.depends('statement', '_parent_statement.journal')
     def on_change_with_statement_journal_bank_account(self, name=None):
@@ -130,7 +370,8 @@ class StatementLine(metaclass=PoolMeta):
     @classmethod
     def _get_relations(cls):
         return super()._get_relations() + [
-            'account.issued.check', 'account.third.check']
+            'account.issued.check', 'account.third.check',
+            'account.third.check.deposit.slip']
 
     @property
     @fields.depends('related_to')
@@ -158,8 +399,45 @@ class StatementLine(metaclass=PoolMeta):
     def third_check(self, value):
         self.related_to = value
 
+    @property
+    @fields.depends('related_to')
+    def deposit_slip(self):
+        pool = Pool()
+        Slip = pool.get('account.third.check.deposit.slip')
+        related_to = getattr(self, 'related_to', None)
+        if isinstance(related_to, Slip) and related_to.id >= 0:
+            return related_to
+
+    @deposit_slip.setter
+    def deposit_slip(self, value):
+        self.related_to = value
+
+    def get_check_match_values(self, check):
+        "Return the values to relate the line to the check"
+        pool = Pool()
+        IssuedCheck = pool.get('account.issued.check')
+        Slip = pool.get('account.third.check.deposit.slip')
+
+        values = {'related_to': str(check)}
+        if isinstance(check, IssuedCheck):
+            party = check.voucher.party if check.voucher else None
+            account = (lookup(check.voucher.journal, 'issued_check_account')
+                if check.voucher else None)
+        elif isinstance(check, Slip):
+            party = None
+            account = lookup(check.bank_account, 'credit_account')
+        else:
+            party = check.source_party
+            account = (lookup(check.account_bank_out, 'credit_account')
+                if check.account_bank_out else None)
+        if not self.party and party:
+            values['party'] = party.id
+        if account:
+            values['account'] = account.id
+        return values
+
     @fields.depends('party', 'statement',
-            methods=['issued_check', 'third_check'])
+            methods=['issued_check', 'third_check', 'deposit_slip'])
     def on_change_related_to(self):
         super().on_change_related_to()
         if self.issued_check:
@@ -173,78 +451,163 @@ class StatementLine(metaclass=PoolMeta):
                 self.party = self.third_check.source_party
             if self.third_check.account_bank_out:
                 self.account = self.third_check.account_bank_out.credit_account
+        if self.deposit_slip:
+            self.account = self.deposit_slip.bank_account.credit_account
 
     @classmethod
-    def create(cls, vlist):
-        pool = Pool()
-        IssuedCheck = pool.get('account.issued.check')
-        ThirdCheck = pool.get('account.third.check')
+    def _parse_related_check(cls, related_to):
+        "Return the model name and id if related_to is a check"
+        if not related_to:
+            return None, None
+        if isinstance(related_to, str):
+            model, id_ = related_to.split(',')
+        else:
+            model, id_ = related_to.__name__, related_to.id
+        if model in {'account.issued.check', 'account.third.check',
+                'account.third.check.deposit.slip'}:
+            return model, int(id_)
+        return None, None
 
+    @classmethod
+    def create(cls, vlist):
         lines = super(StatementLine, cls).create(vlist)
-        update_issued = {}
-        update_third = {}
+        updates = defaultdict(dict)
         for l in lines:
-            if l.related_to:
-                if str(l.related_to).split(',')[0] == IssuedCheck.__name__:
-                    check_id = int(str(l.related_to).split(',')[1])
-                    update_issued[check_id] = l.id
-                elif str(l.related_to).split(',')[0] == ThirdCheck.__name__:
-                    check_id = int(str(l.related_to).split(',')[1])
-                    update_third[check_id] = l.id
-        if update_issued:
-            cls.update_issued_checks(update_issued)
-        if update_third:
-            cls.update_third_checks(update_third)
+            model, check_id = cls._parse_related_check(l.related_to)
+            if model:
+                updates[model][check_id] = l.id
+        cls._update_related_checks(updates)
         return lines
 
     @classmethod
     def write(cls, *args):
-        pool = Pool()
-        IssuedCheck = pool.get('account.issued.check')
-        ThirdCheck = pool.get('account.third.check')
-
         actions = iter(args)
-        update_issued = {}
-        update_third = {}
+        updates = defaultdict(dict)
         for lines, values in zip(actions, actions):
-            if 'related_to' in values:
-                if values['related_to'] is None:
-                    if isinstance(lines[0].related_to, IssuedCheck):
-                        update_issued[lines[0].related_to.id] = None
-                    elif isinstance(lines[0].related_to, ThirdCheck):
-                        update_third[lines[0].related_to.id] = None
-                elif values['related_to'].split(',')[0] \
-                        == IssuedCheck.__name__:
-                    check_id = int(values['related_to'].split(',')[1])
-                    update_issued[check_id] = lines[0].id
-                elif values['related_to'].split(',')[0] \
-                        == ThirdCheck.__name__:
-                    check_id = int(values['related_to'].split(',')[1])
-                    update_third[check_id] = lines[0].id
+            if 'related_to' not in values:
+                continue
+            # Unlink the checks previously related
+            for line in lines:
+                model, check_id = cls._parse_related_check(line.related_to)
+                if model:
+                    updates[model][check_id] = None
+            model, check_id = cls._parse_related_check(values['related_to'])
+            if model:
+                for line in lines:
+                    updates[model][check_id] = line.id
         super(StatementLine, cls).write(*args)
-        if update_issued:
-            cls.update_issued_checks(update_issued)
-        if update_third:
-            cls.update_third_checks(update_third)
+        cls._update_related_checks(updates)
 
-    def update_issued_checks(update_issued):
+    @classmethod
+    def _update_related_checks(cls, updates):
+        "Update the statement line of the related checks per model"
+        if updates.get('account.issued.check'):
+            cls.update_issued_checks(updates['account.issued.check'])
+        if updates.get('account.third.check'):
+            cls.update_third_checks(updates['account.third.check'])
+        if updates.get('account.third.check.deposit.slip'):
+            cls.update_deposit_slips(
+                updates['account.third.check.deposit.slip'])
+
+    @classmethod
+    def _line2check_ids(cls, check2line):
+        line2check_ids = defaultdict(list)
+        for check_id, line_id in check2line.items():
+            line2check_ids[line_id].append(check_id)
+        return line2check_ids
+
+    @classmethod
+    def update_issued_checks(cls, update_issued):
         pool = Pool()
         IssuedCheck = pool.get('account.issued.check')
 
-        issued_checks = []
-        for key in update_issued:
-            check = IssuedCheck(key)
-            check.related_statement_line = update_issued[key]
-            issued_checks.append(check)
-        IssuedCheck.save(issued_checks)
+        to_write = []
+        for line_id, check_ids in cls._line2check_ids(update_issued).items():
+            to_write.extend((IssuedCheck.browse(check_ids), {
+                        'related_statement_line': line_id,
+                        }))
+        if to_write:
+            IssuedCheck.write(*to_write)
 
-    def update_third_checks(update_third):
+    @classmethod
+    def update_third_checks(cls, update_third):
         pool = Pool()
         ThirdCheck = pool.get('account.third.check')
 
-        third_checks = []
-        for key in update_third:
-            check = ThirdCheck(key)
-            check.related_statement_line = update_third[key]
-            third_checks.append(check)
-        ThirdCheck.save(third_checks)
+        to_write = []
+        for line_id, check_ids in cls._line2check_ids(update_third).items():
+            to_write.extend((ThirdCheck.browse(check_ids), {
+                        'related_statement_line': line_id,
+                        }))
+        if to_write:
+            ThirdCheck.write(*to_write)
+
+    @classmethod
+    def update_deposit_slips(cls, update_slips):
+        pool = Pool()
+        Slip = pool.get('account.third.check.deposit.slip')
+
+        to_write = []
+        for line_id, slip_ids in cls._line2check_ids(update_slips).items():
+            to_write.extend((Slip.browse(slip_ids), {
+                        'related_statement_line': line_id,
+                        }))
+        if to_write:
+            Slip.write(*to_write)
+
+
+class StatementLineCheckReview(ModelSQL, ModelView):
+    'Statement Line Check Review'
+    __name__ = 'account.statement.line.check_review'
+
+    statement = fields.Many2One('account.statement', 'Statement',
+        required=True, ondelete='CASCADE', readonly=True)
+    line = fields.Many2One('account.statement.line', 'Line',
+        required=True, ondelete='CASCADE', readonly=True,
+        domain=[('statement', '=', Eval('statement', -1))])
+    check = fields.Reference('Check', [
+            ('account.issued.check', 'Issued Check'),
+            ('account.third.check', 'Third Check'),
+            ('account.third.check.deposit.slip', 'Deposit Slip'),
+            ], required=True, readonly=True)
+    date = fields.Function(fields.Date('Date'), 'get_line_field')
+    amount = fields.Function(fields.Numeric('Amount', digits=(16, 2)),
+        'get_line_field')
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls._order.insert(0, ('line', 'ASC'))
+        cls._buttons.update({
+                'accept': {},
+                })
+
+    def get_line_field(self, name):
+        return getattr(self.line, name)
+
+    @classmethod
+    @instrumented
+    @ModelView.button
+    def accept(cls, reviews):
+        "Relate each line to the check of the review"
+        pool = Pool()
+        StatementLine = pool.get('account.statement.line')
+
+        to_write = []
+        lines, checks = set(), set()
+        for review in reviews:
+            if review.line in lines or review.check in checks:
+                continue
+            if (review.line.related_to
+                    or review.line.statement.state != 'draft'):
+                continue
+            lines.add(review.line)
+            checks.add(review.check)
+            to_write.extend(([review.line],
+                    review.line.get_check_match_values(review.check)))
+        if to_write:
+            StatementLine.write(*to_write)
+        cls.delete(cls.search(['OR',
+                    ('line', 'in', [l.id for l in lines]),
+                    ('check', 'in', [str(c) for c in checks]),
+                    ]))
@@ -0,0 +1,128 @@
+# This file is part of the account_check_ar module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from trytond import backend
+from trytond.config import config
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.pool import Pool
+
+logger = logging.getLogger(__name__)
+_backend_logger = logging.getLogger('trytond.backend')
+_local = threading.local()
+
+
+class QueryCounter(logging.Handler):
+    """Handler counting the SQL statements of the current thread
+
+    The database backends log each statement without arguments at debug
+    level."""
+
+    def __init__(self):
+        super().__init__()
+        self.thread = threading.get_ident()
+        self.count = 0
+
+    def emit(self, record):
+        if record.thread == self.thread and not record.args:
+            self.count += 1
+
+
+@contextmanager
+def count_queries():
+    """Yield a QueryCounter of the statements executed in the context
+
+    Its count is None if the backend does not log the statements at debug
+    level."""
+    counter = QueryCounter()
+    database_logger = logging.getLogger(
+        'trytond.backend.%s.database' % backend.name)
+    if not database_logger.isEnabledFor(logging.DEBUG):
+        counter.count = None
+        yield counter
+        return
+    _backend_logger.addHandler(counter)
+    try:
+        yield counter
+    finally:
+        _backend_logger.removeHandler(counter)
+
+
+def _store_stats():
+    return config.getboolean('account_check_ar', 'stats', default=False)
+
+
+def add_moves(moves):
+    "Count the moves created by the running instrumented operations"
+    for measure in getattr(_local, 'measures', []):
+        measure['moves'] += len(moves)
+
+
+def instrumented(func):
+    '''
+    Measure the elapsed time, SQL statements, records and moves of an
+    operation. The measure is logged at debug level and stored as
+    account.check.stat when the stats option of account_check_ar section
+    is set in the configuration.
+    '''
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        store = _store_stats()
+        if not store and not logger.isEnabledFor(logging.DEBUG):
+            return func(self, *args, **kwargs)
+
+        if args and isinstance(args[0], (list, tuple)):
+            records = len(args[0])
+        else:
+            records = len(getattr(self, 'records', None) or [])
+        measure = {'moves': 0}
+        measures = _local.__dict__.setdefault('measures', [])
+        measures.append(measure)
+        with count_queries() as counter:
+            start = time.perf_counter()
+            try:
+                result = func(self, *args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                measures.remove(measure)
+                operation = '%s.%s' % (self.__name__, func.__name__)
+                logger.debug(
+                    "%s: %.3fs, %s queries, %s records, %s moves",
+                    operation, duration, counter.count, records,
+                    measure['moves'])
+        if store:
+            Stat = Pool().get('account.check.stat')
+            Stat.create([{
+                        'operation': operation,
+                        'duration': duration,
+                        'queries': counter.count,
+                        'records': records,
+                        'moves': measure['moves'],
+                        }])
+        return result
+    return wrapper
+
+
+class CheckStat(ModelSQL, ModelView):
+    'Check Operation Statistic'
+    __name__ = 'account.check.stat'
+
+    operation = fields.Char('Operation', required=True, readonly=True)
+    duration = fields.Float('Duration', readonly=True,
+        help="In seconds.")
+    queries = fields.Integer('Queries', readonly=True)
+    records = fields.Integer('Records', readonly=True)
+    moves = fields.Integer('Moves', readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls._order = [
+            ('create_date', 'DESC'),
+            ('id', 'DESC'),
+            ]
@@ -0,0 +1,337 @@
+# This file is part of the account_check_ar module for Tryton.
+# The COPYRIGHT file at the top level of this repository contains
+# the full copyright notices and license terms.
+'''
+Benchmark of the check workflows on synthetic data.
+
+It is not part of the test suite and must be run explicitly against a
+SQLite or PostgreSQL database, for example:
+
+    DB_NAME=:memory: python -m trytond.modules.account_check_ar.tests.benchmark
+
+    TRYTOND_DATABASE_URI=postgresql:// DB_NAME=bench \\
+        python -m trytond.modules.account_check_ar.tests.benchmark \\
+        --checks 2000 --vouchers 500 --lines 1000
+'''
+import argparse
+import logging
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from trytond.tests.test_tryton import activate_module, DB_NAME
+from trytond.pool import Pool
+from trytond.transaction import Transaction
+
+from trytond.modules.company.tests import create_company, set_company
+from trytond.modules.account.tests import create_chart, get_fiscalyear
+from trytond.modules.account_check_ar.stats import count_queries
+
+
+@contextmanager
+def measure(results, name, records):
+    "Store the wall time and the number of queries of the block"
+    with count_queries() as counter:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            results.append((name, records, elapsed, counter.count))
+
+
+def run_wizard(name, model, records, start_values, transition):
+    Wizard = Pool().get(name, type='wizard')
+    session_id, _, _ = Wizard.create()
+    wizard = Wizard(session_id)
+    for field, value in start_values.items():
+        setattr(wizard.start, field, value)
+    with Transaction().set_context(
+            active_model=model,
+            active_id=records[0].id if records else None,
+            active_ids=[r.id for r in records]):
+        getattr(wizard, 'transition_%s' % transition)()
+
+
+def setup_data(company, args):
+    pool = Pool()
+    Account = pool.get('account.account')
+    FiscalYear = pool.get('account.fiscalyear')
+    Journal = pool.get('account.journal')
+    Party = pool.get('party.party')
+    Bank = pool.get('bank')
+    BankAccount = pool.get('bank.account')
+    Sequence = pool.get('ir.sequence')
+    ModelData = pool.get('ir.model.data')
+    Checkbook = pool.get('account.checkbook')
+
+    create_chart(company)
+    fiscalyear = get_fiscalyear(company)
+    fiscalyear.save()
+    FiscalYear.create_period([fiscalyear])
+
+    cash, = Account.search([('name', '=', 'Main Cash')])
+    revenue, = Account.search([('name', '=', 'Main Revenue')])
+    expense, = Account.search([('name', '=', 'Main Expense')])
+    journal, = Journal.search([('code', '=', 'CASH')])
+    journal.third_check_account = revenue
+    journal.issued_check_account = expense
+    journal.rejected_check_account = revenue
+    journal.save()
+
+    bank_party, = Party.create([{'name': 'Bank'}])
+    bank, = Bank.create([{'party': bank_party.id}])
+    bank_account, = BankAccount.create([{
+                'bank': bank.id,
+                'currency': company.currency.id,
+                'owners': [('add', [company.party.id])],
+                'numbers': [('create', [{
+                                'type': 'other',
+                                'number': '0001',
+                                }])],
+                'journal': journal.id,
+                'debit_account': cash.id,
+                'credit_account': cash.id,
+                }])
+    parties = Party.create([{'name': 'Party %s' % i}
+            for i in range(args.parties)])
+
+    sequence, = Sequence.create([{
+                'name': 'Checkbook',
+                'sequence_type': ModelData.get_id(
+                    'account_check_ar', 'sequence_type_account_checkbook'),
+                'padding': 8,
+                }])
+    checkbook, = Checkbook.create([{
+                'name': 'Checkbook',
+                'bank_account': bank_account.id,
+                'sequence': sequence.id,
+                'last_number': 10 ** 7,
+                }])
+    Checkbook.activate([checkbook])
+    return {
+        'journal': journal,
+        'cash': cash,
+        'bank': bank,
+        'bank_account': bank_account,
+        'checkbook': checkbook,
+        'parties': parties,
+        }
+
+
+def create_checks(company, data, args):
+    pool = Pool()
+    IssuedCheck = pool.get('account.issued.check')
+    ThirdCheck = pool.get('account.third.check')
+    Date = pool.get('ir.date')
+
+    today = Date.today()
+    parties = data['parties']
+    issued_checks = IssuedCheck.create([{
+                'name': '%08d' % i,
+                'bank_account': data['bank_account'].id,
+                'amount': Decimal(100 + i % 97),
+                'date': today,
+                'receiving_party': parties[i % len(parties)].id,
+                'state': 'issued',
+                } for i in range(args.checks)])
+    third_checks = ThirdCheck.create([{
+                'name': '%08d' % i,
+                'bank': data['bank'].id,
+                'currency': company.currency.id,
+                'amount': Decimal(100 + i % 89),
+                'date': today,
+                'source_party': parties[i % len(parties)].id,
+                } for i in range(args.checks)])
+    return issued_checks, third_checks
+
+
+def bench_wizards(results, data, issued_checks, third_checks):
+    pool = Pool()
+    Date = pool.get('ir.date')
+    today = Date.today()
+    journal = data['journal']
+    bank_account = data['bank_account']
+
+    with measure(results, 'ThirdCheckHeld', len(third_checks)):
+        run_wizard('account.third.check.held', 'account.third.check',
+            third_checks, {
+                'journal': journal,
+                'credit_account': data['cash'],
+                }, 'held')
+    with measure(results, 'ThirdCheckDeposit', len(third_checks)):
+        run_wizard('account.third.check.deposit', 'account.third.check',
+            third_checks, {
+                'bank_account': bank_account,
+                'date': today,
+                'grouping': 'check',
+                }, 'deposit')
+    with measure(results, 'ThirdCheckRevertDeposit', len(third_checks)):
+        run_wizard('account.third.check.revert_deposit',
+            'account.third.check', third_checks, {
+                'date': today,
+                }, 'revert')
+    with measure(results, 'ThirdCheckReject', len(third_checks)):
+        run_wizard('account.third.check.reject', 'account.third.check',
+            third_checks, {
+                'journal': journal,
+                }, 'reject')
+    with measure(results, 'ThirdCheckRevertReject', len(third_checks)):
+        run_wizard('account.third.check.revert_reject',
+            'account.third.check', third_checks, {
+                'journal': journal,
+                }, 'revert')
+    with measure(results, 'ThirdCheckDeposit (deposit)', len(third_checks)):
+        run_wizard('account.third.check.deposit', 'account.third.check',
+            third_checks, {
+                'bank_account': bank_account,
+                'date': today,
+                'grouping': 'deposit',
+                }, 'deposit')
+    with measure(results, 'IssuedCheckDebit', len(issued_checks)):
+        run_wizard('account.issued.check.debit', 'account.issued.check',
+            issued_checks, {
+                'bank_account': bank_account,
+                'date': today,
+                }, 'debit')
+    with measure(results, 'IssuedCheckRevertDebit', len(issued_checks)):
+        run_wizard('account.issued.check.revert_debit',
+            'account.issued.check', issued_checks, {
+                'date': today,
+                }, 'revert')
+    with measure(results, 'IssuedCheckCancel', len(issued_checks)):
+        number_next = data['checkbook'].sequence.number_next
+        run_wizard('account.issued.check.cancel', None, [], {
+                'checkbook': data['checkbook'],
+                'from_number': number_next,
+                'to_number': number_next + len(issued_checks) - 1,
+                'date': today,
+                }, 'cancel')
+
+
+def bench_vouchers(results, company, data, args):
+    pool = Pool()
+    Voucher = pool.get('account.voucher')
+    Date = pool.get('ir.date')
+
+    today = Date.today()
+    parties = data['parties']
+    vouchers = Voucher.create([{
+                'party': parties[i % len(parties)].id,
+                'voucher_type': 'receipt',
+                'journal': data['journal'].id,
+                'currency': company.currency.id,
+                'date': today,
+                'third_check': [('create', [{
+                                'name': 'V%07d' % i,
+                                'bank': data['bank'].id,
+                                'currency': company.currency.id,
+                                'amount': Decimal(100 + i % 89),
+                                'date': today,
+                                }])],
+                } for i in range(args.vouchers)])
+    with measure(results, 'AccountVoucher.post', len(vouchers)):
+        Voucher.post(vouchers)
+    with measure(results, 'AccountVoucher.cancel', len(vouchers)):
+        Voucher.cancel(vouchers)
+
+
+def bench_statements(results, company, data, args):
+    pool = Pool()
+    Journal = pool.get('account.journal')
+    Statement = pool.get('account.statement')
+    StatementJournal = pool.get('account.statement.journal')
+    Voucher = pool.get('account.voucher')
+    Date = pool.get('ir.date')
+
+    today = Date.today()
+    parties = data['parties']
+    # The statement lines can only be related to the checks issued by
+    # posted payment vouchers from a checkbook of the statement bank account
+    vouchers = Voucher.create([{
+                'party': parties[i % len(parties)].id,
+                'voucher_type': 'payment',
+                'journal': data['journal'].id,
+                'currency': company.currency.id,
+                'date': today,
+                'issued_check': [('create', [{
+                                'checkbook': data['checkbook'].id,
+                                'bank_account': data['bank_account'].id,
+                                'amount': Decimal(100 + i % 97),
+                                'date': today,
+                                }])],
+                } for i in range(args.lines)])
+    Voucher.post(vouchers)
+    checks = [c for v in vouchers for c in v.issued_check]
+    journal, = Journal.search([('code', '=', 'STA')])
+    statement_journal, = StatementJournal.create([{
+                'name': 'Bank',
+                'journal': journal.id,
+                'account': data['cash'].id,
+                'bank_account': data['bank_account'].id,
+                'currency': company.currency.id,
+                'company': company.id,
+                'validation': 'number_of_lines',
+                }])
+    statement, = Statement.create([{
+                'name': 'Benchmark',
+                'journal': statement_journal.id,
+                'date': today,
+                'number_of_lines': len(checks),
+                'lines': [('create', [{
+                                'number': str(i),
+                                'date': today,
+                                'amount': -check.amount,
+                                'party': check.voucher.party.id,
+                                'account': data['journal']
+                                .issued_check_account.id,
+                                'related_to': str(check),
+                                } for i, check in enumerate(checks)])],
+                }])
+    with measure(results, 'Statement.validate_statement', len(checks)):
+        Statement.validate_statement([statement])
+    with measure(results, 'Statement.post', len(checks)):
+        Statement.post([statement])
+
+
+def report(results):
+    print('%-32s %8s %10s %10s %10s %8s' % (
+            'Step', 'Records', 'Time (s)', 'ms/rec', 'Queries', 'q/rec'))
+    for name, records, elapsed, queries in results:
+        records_ = records or 1
+        print('%-32s %8d %10.3f %10.3f %10d %8.2f' % (
+                name, records, elapsed, elapsed * 1000 / records_,
+                queries, queries / records_))
+
+
+def main(args):
+    # The queries are counted from the statements logged by the backend
+    backend_logger = logging.getLogger('trytond.backend')
+    backend_logger.setLevel(logging.DEBUG)
+    backend_logger.propagate = False
+    activate_module(['account_check_ar', 'account_statement'])
+    results = []
+    with Transaction().start(DB_NAME, 0, context={}) as transaction:
+        company = create_company()
+        with set_company(company):
+            data = setup_data(company, args)
+            issued_checks, third_checks = create_checks(company, data, args)
+            bench_wizards(results, data, issued_checks, third_checks)
+            bench_vouchers(results, company, data, args)
+            bench_statements(results, company, data, args)
+        transaction.rollback()
+    report(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark the check workflows on synthetic data")
+    parser.add_argument('--checks', type=int, default=500,
+        help="number of issued and third checks")
+    parser.add_argument('--vouchers', type=int, default=100,
+        help="number of receipt vouchers")
+    parser.add_argument('--lines', type=int, default=500,
+        help="number of statement lines")
+    parser.add_argument('--parties', type=int, default=50,
+        help="number of parties")
+    main(parser.parse_args())
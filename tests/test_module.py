@@ -1,8 +1,14 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
+from decimal import Decimal
+
+from trytond.exceptions import UserError
+from trytond.modules.account_check_ar.account_check_ar import (
+    ThirdCheckImport)
+from trytond.modules.account_check_ar.account_voucher_ar import select_checks
 from trytond.modules.company.tests import CompanyTestMixin
-from trytond.tests.test_tryton import ModuleTestCase
+from trytond.tests.test_tryton import ModuleTestCase, with_transaction
 
 
 class CheckArTestCase(CompanyTestMixin, ModuleTestCase):
@@ -10,5 +16,40 @@ class CheckArTestCase(CompanyTestMixin, ModuleTestCase):
     module = 'account_check_ar'
     extras = ['account_statement']
 
+    def test_select_checks(self):
+        "Test select checks"
+        for candidates, target, result in [
+                ([5, 3, 4], 7, [1, 2]),
+                ([5, 3, 4], 9, [0, 2]),
+                ([2, 2, 2], 4, [0, 1]),
+                ([10, 20], 5, []),
+                ([], 5, []),
+                ]:
+            with self.subTest(candidates=candidates, target=target):
+                self.assertEqual(select_checks(candidates, target), result)
+
+    def test_parse_amount(self):
+        "Test parse amount of third check import"
+        for value, result in [
+                ('1234.56', Decimal('1234.56')),
+                ('1234,56', Decimal('1234.56')),
+                ('1,234.56', Decimal('1234.56')),
+                ('1.234,56', Decimal('1234.56')),
+                ('1.234.567', Decimal('1234567')),
+                ('0,500', Decimal('0.5')),
+                ('12', Decimal('12')),
+                ]:
+            with self.subTest(value=value):
+                self.assertEqual(
+                    ThirdCheckImport._parse_amount(value, 1), result)
+
+    @with_transaction()
+    def test_parse_amount_ambiguous(self):
+        "Test parse ambiguous amount of third check import"
+        for value in ['1,234', '1.234']:
+            with self.subTest(value=value):
+                with self.assertRaises(UserError):
+                    ThirdCheckImport._parse_amount(value, 1)
+
 
 del ModuleTestCase